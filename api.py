@@ -0,0 +1,95 @@
+import json
+import logging
+import sys
+from urllib.parse import unquote
+
+from breaker import UpstreamUnavailable
+from ratelimit import RateLimited
+from records import ProfileRecord, dumps, etag_matches
+from scrape import add_track_status
+
+logger = logging.getLogger(__name__)
+
+# Request checks and response encoding of the two profile routes, shared by the Flask-free entry
+# points (serverless.py, asgi.py). They only differ in how they read the request, get the profile
+# (blocking or awaited) and write the response. Statuses and errors match app.py, which (like
+# index.py) uses the same profile encoding and error mapping.
+MAX_BODY_BYTES = 64 * 1024
+
+
+def parse_json_body(body):
+    # The request's JSON object, or None for an empty, oversized or malformed body
+    if not body or len(body) > MAX_BODY_BYTES:
+        return None
+    try:
+        request_data = json.loads(body)
+    except ValueError:
+        return None
+    return request_data if isinstance(request_data, dict) else None
+
+
+def points_request(request_data):
+    # Returns (url, None), or (None, (status, data)) for a bad request
+    if not request_data or 'url' not in request_data:
+        return None, (400, {'error': 'No URL provided in the request body'})
+
+    url = unquote(request_data['url'])
+    if not url.startswith("http"):
+        return None, (400, {'error': 'Invalid URL provided'})
+    return url, None
+
+
+def track_request(request_data):
+    # Returns (url, lastdate, None), or (None, None, (status, data)) for a bad request
+    if not request_data or 'url' not in request_data or 'lastdate' not in request_data:
+        return None, None, (400, {'error': 'Both URL and lastdate are required'})
+
+    url = unquote(request_data['url'])
+    if not url.startswith("http"):
+        return None, None, (400, {'error': 'Invalid URL provided'})
+    return url, request_data['lastdate'], None
+
+
+def track_response(record, lastdate):
+    # The status is added to a copy, so the cached record stays as it is
+    profile_data = record.to_dict()
+    try:
+        add_track_status(profile_data, lastdate)
+    except ValueError:
+        return 400, {'error': 'Invalid lastdate format. Please use dd-mm-yyyy.'}
+    return 200, profile_data
+
+
+def retry_after_header(retry_after):
+    return 'Retry-After', str(max(1, int(retry_after + 0.5)))
+
+
+def error_response(e):
+    # (status, data, headers) for an error raised while answering, with the statuses of app.py's
+    # error handlers: 503 while Skillrack is unavailable, 429 for a client over its rate (both
+    # with their retry hint as Retry-After), 503 when the snapshot store fails, 500 otherwise
+    if isinstance(e, UpstreamUnavailable):
+        return 503, {'error': str(e)}, [retry_after_header(e.retry_after)] if e.retry_after is not None else []
+    if isinstance(e, RateLimited):
+        return 429, {'error': str(e)}, [retry_after_header(e.retry_after)]
+    # sqlite3 is only loaded once the snapshot store is used, and only then can it have failed
+    sqlite3 = sys.modules.get('sqlite3')
+    if sqlite3 is not None and isinstance(e, sqlite3.Error):
+        logger.error('Snapshot store error', exc_info=e)
+        return 503, {'error': 'Profile history is temporarily unavailable'}, []
+    logger.error('Unhandled error', exc_info=e)
+    return 500, {'error': 'Internal Server Error'}, []
+
+
+def encode_response(status, data, if_none_match=None, headers=()):
+    # (status, headers, body) matching Flask's jsonify output: sorted keys, compact separators,
+    # trailing newline. A profile record gets an ETag, and a 304 without a body while the
+    # client's copy is current.
+    headers = list(headers)
+    if isinstance(data, ProfileRecord):
+        etag = data.etag()
+        headers.append(('ETag', etag))
+        if etag_matches(if_none_match, etag):
+            return 304, headers, b''
+    body = (data.json_bytes() if isinstance(data, ProfileRecord) else dumps(data)) + b'\n'
+    return status, [('Content-Type', 'application/json'), ('Content-Length', str(len(body))), *headers], body
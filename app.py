@@ -1,93 +1,169 @@
-from flask import Flask, jsonify, request
-from bs4 import BeautifulSoup
-import requests
+from flask import Flask, Response, g, jsonify, request
+from flask.json.provider import DefaultJSONProvider
+import sqlite3
+import time
 from datetime import datetime
-from urllib.parse import urlparse, parse_qs
 from werkzeug.urls import unquote
+from cache import profile_cache, normalize_profile_key
+from singleflight import profile_flight
+from snapshots import snapshot_store, store_enabled, validate_day
+from cohort import COHORT_MAX_PROFILES, DEFAULT_POINTS_PER_DAY, compute_cohort
+from breaker import OPEN, HALF_OPEN, UpstreamUnavailable, upstream_guard
+from scrape import add_track_status, cached_profile, get_profile, profile_refresher
+from batch import BATCH_MAX_URLS, fetch_many
+import metrics
+from metrics import REQUEST_SECONDS, REQUESTS_IN_FLIGHT, Counter, Gauge, stage
+from records import ProfileRecord, dumps, dumps_profiles
+from api import encode_response
+from ratelimit import RATE_LIMIT_ENABLED, RateLimited, client_id, client_limiter, scrape_queue
+
+
+# jsonify through a provider that times response serialization as its own stage
+class TimedJSONProvider(DefaultJSONProvider):
+    def response(self, *args, **kwargs):
+        with stage('serialize'):
+            return super().response(*args, **kwargs)
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, ProfileRecord):
+            return o.to_dict()
+        return DefaultJSONProvider.default(o)
+
 
 app = Flask(__name__)
+app.json = TimedJSONProvider(app)
+
+
+# Respond with already-encoded JSON (profile records cache their own encoding)
+def json_bytes_response(body, status=200):
+    return Response(body + b'\n', status=status, mimetype='application/json')
+
+
+# Profile response with an ETag for its stats; 304 without a body while the client's copy is current
+def profile_response(data):
+    with stage('serialize'):
+        status, headers, body = encode_response(200, data, request.headers.get('If-None-Match'))
+    return Response(body, status=status, headers=headers)
+
+
+# Client identity for rate limiting and the fair scrape queue (None when limiting is off)
+def request_client():
+    return client_id(request.headers, request.remote_addr) if RATE_LIMIT_ENABLED else None
+
+
+# Profile lookup for a single-profile request: over its request rate, a client gets whatever is
+# cached (nothing is scraped for it), or a 429 when nothing is
+def get_profile_limited(url):
+    client = request_client()
+    if client is not None:
+        retry_after = client_limiter.try_acquire(client)
+        if retry_after:
+            cached = cached_profile(url)
+            if cached is None:
+                raise RateLimited('Too many requests, slow down', retry_after=retry_after)
+            return cached
+    return get_profile(url, client)
+
+
+# Charges a multi-profile request to the client's rate (one token, however many URLs; its
+# scrapes still take turns in the fair queue) and returns the client
+def limit_multi_profile_request():
+    client = request_client()
+    if client is not None:
+        retry_after = client_limiter.try_acquire(client)
+        if retry_after:
+            raise RateLimited('Too many requests, slow down', retry_after=retry_after)
+    return client
+
+
+def cache_hit_ratio():
+    lookups = profile_cache.hits + profile_cache.stale_hits + profile_cache.misses
+    return (profile_cache.hits + profile_cache.stale_hits) / lookups if lookups else 0
+
+
+Counter('skillrack_cache_hits_total', 'Fresh profile cache hits', callback=lambda: profile_cache.hits)
+Counter('skillrack_cache_stale_hits_total', 'Stale profile cache hits served while refreshing', callback=lambda: profile_cache.stale_hits)
+Counter('skillrack_cache_misses_total', 'Profile cache misses', callback=lambda: profile_cache.misses)
+Gauge('skillrack_cache_hit_ratio', 'Share of profile lookups served from the cache', callback=cache_hit_ratio)
+Counter('skillrack_singleflight_coalesced_total', 'Profile fetches that waited on an in-flight fetch', callback=lambda: profile_flight.coalesced)
+Gauge('skillrack_circuit_state', 'Upstream circuit state (0 closed, 1 half-open, 2 open)',
+      callback=lambda: {HALF_OPEN: 1, OPEN: 2}.get(upstream_guard.breaker.state, 0))
+Counter('skillrack_circuit_trips_total', 'Times the upstream circuit opened', callback=lambda: upstream_guard.breaker.trips)
+Counter('skillrack_circuit_rejected_total', 'Fetches failed fast by the open circuit', callback=lambda: upstream_guard.breaker.rejected)
+Gauge('skillrack_upstream_concurrency_limit', 'Current adaptive limit on concurrent upstream fetches', callback=lambda: int(upstream_guard.limiter.limit))
+Counter('skillrack_upstream_limit_rejected_total', 'Fetches that gave up waiting for an upstream slot', callback=lambda: upstream_guard.limiter.rejected)
+Counter('skillrack_rate_limited_total', 'Requests over their client request rate', callback=lambda: client_limiter.limited)
+Counter('skillrack_scrape_queue_rejected_total', 'Scrapes refused or timed out in the fair queue', callback=lambda: scrape_queue.rejected)
+Gauge('skillrack_scrape_queue_waiting', 'Scrapes waiting for their turn in the fair queue', callback=lambda: scrape_queue.status()['waiting'])
+
+
+# Skillrack is down or overloaded and there was no cached copy to fall back to
+@app.errorhandler(UpstreamUnavailable)
+def upstream_unavailable(e):
+    response = jsonify({'error': str(e)})
+    response.status_code = 503
+    if e.retry_after is not None:
+        response.headers['Retry-After'] = str(max(1, int(e.retry_after + 0.5)))
+    return response
+
+
+# The client is over its request rate (or its scrapes can't get a turn) and nothing was cached
+@app.errorhandler(RateLimited)
+def rate_limited(e):
+    response = jsonify({'error': str(e)})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(max(1, int(e.retry_after + 0.5)))
+    return response
+
+
+# The snapshot database failed mid-request (locked past its timeout, disk full, ...)
+@app.errorhandler(sqlite3.Error)
+def snapshot_store_error(e):
+    app.logger.exception('Snapshot store error')
+    return jsonify({'error': 'Profile history is temporarily unavailable'}), 503
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    g.trace_token = metrics.start_trace()
+    REQUESTS_IN_FLIGHT.inc()
+
+
+@app.after_request
+def observe_request(response):
+    if 'request_started' in g:
+        duration = time.perf_counter() - g.request_started
+        REQUEST_SECONDS.observe(duration, endpoint=request.endpoint or 'unknown', status=response.status_code)
+        metrics.finish_trace(g.pop('trace_token', None), request.endpoint or 'unknown', response.status_code, duration)
+    return response
+
+
+@app.teardown_request
+def end_request(exc):
+    if g.pop('request_started', None) is not None:
+        REQUESTS_IN_FLIGHT.dec()
+
+
+# Define the Prometheus scrape endpoint
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+# Define the endpoint that exposes the upstream circuit breaker and concurrency limiter
+@app.route('/api/upstream', methods=['GET'])
+def get_upstream_status():
+    return jsonify(upstream_guard.status())
+
+
+# Define the endpoint that dumps the stage breakdown of the slowest sampled requests
+@app.route('/metrics/slowest', methods=['GET'])
+def get_slowest_requests():
+    return jsonify({'sample_rate': metrics.TRACE_SAMPLE_RATE, 'requests': metrics.slowest_traces()})
 
 
-def scrape_skillrack_profile(url):
-    response = requests.get(url)
-    soup = BeautifulSoup(response.text, 'html.parser')
-
-    # Initialize variables for the profile data
-    profile_data = {
-        'id': '',
-        'name': '',
-        'dept': '',
-        'year': '',
-        'college': '',
-        'code_tutor': 0,
-        'code_track': 0,
-        'code_test': 0,
-        'dt': 0,
-        'dc': 0,
-        'points': 0,
-        'required_points': 5000,
-        'deadline': '30-04-2024',
-        'percentage': 100,
-        'last_fetched': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-        'url': url
-    }
-
-    # Extract profile ID from the URL
-    parsed_url = urlparse(url)
-    profile_data['id'] = parse_qs(parsed_url.query).get('id', [None])[0]
-    # profile_data['id'] = parse_qs(parsed_url.query).get('id', [None])[0]
-    # Extract the name
-    name_div = soup.find('div', {'class': 'ui big label black'})  # Verify this selector
-    if name_div:
-        profile_data['name'] = name_div.text.strip()
-
-    # Extract department, year, and college
-    profile_div = soup.find('div', {'class': 'ui four wide center aligned column'})  # Verify this selector
-    if profile_div:
-        raw_text = profile_div.text.strip().split('\n')
-        if len(raw_text) > 8:  # Ensure the expected structure exists
-            profile_data['dept'] = raw_text[4].strip()
-            profile_data['college'] = raw_text[6].strip()
-            profile_data['year'] = raw_text[8].strip()[-4:]  # Last 4 digits as year
-    
-    # Extract statistics
-    statistics_div = soup.find_all('div', class_='statistic')
-    labels_to_extract = {
-        'CODE TUTOR': 'code_tutor',
-        'CODE TEST': 'code_test',
-        'CODE TRACK': 'code_track',
-        'DC': 'dc',
-        'DT': 'dt',
-        'Points': 'points',
-        'Required Points': 'required_points',
-        'Deadline': 'deadline',
-        'Percentage': 'percentage'
-    }
-
-    for stat in statistics_div:
-        label_div = stat.find('div', class_='label')
-        if label_div:
-            label = label_div.get_text(strip=True)
-            if label in labels_to_extract:
-                value_div = stat.find('div', class_='value')
-                if value_div:
-                    value = value_div.get_text(strip=True)
-                    if label == 'Percentage':
-                        try:
-                            profile_data['percentage'] = int(value.replace('%', ''))
-                        except ValueError:
-                            profile_data['percentage'] = 100
-                    elif label == 'Deadline':
-                        profile_data['deadline'] = '30-04-2024'
-                    else:
-                        try:
-                            profile_data[labels_to_extract[label]] = int(value)
-                        except ValueError:
-                            profile_data[labels_to_extract[label]] = value
-    profile_data['points'] = (profile_data['code_test']*30)+(profile_data['dc']*2)+(profile_data['dt']*20)+(profile_data['code_track']*2)
-    profile_data['percentage_completed'] = (profile_data['points'] / profile_data['required_points']) * 100
-    profile_data['id'] = profile_data['url'].split('/')[4]
-    return profile_data
 # Define the API endpoint to track points and deadline progress
 @app.route('/api/trackwithbuddy', methods=['POST'])
 def track_with_buddy():
@@ -106,32 +182,14 @@ def track_with_buddy():
     if not url.startswith("http"):
         return jsonify({'error': 'Invalid URL provided'}), 400
 
-    # Scrape the profile data from Skillrack
-    profile_data = scrape_skillrack_profile(url)
+    # Scrape the profile data from Skillrack (or the cache); the status is added to a copy
+    profile_data = get_profile_limited(url).to_dict()
 
-    # Parse the lastdate and calculate days left until deadline
+    # Work out whether the profile will reach its required points by the lastdate
     try:
-        lastdate_obj = datetime.strptime(lastdate, '%d-%m-%Y')
+        add_track_status(profile_data, lastdate)
     except ValueError:
         return jsonify({'error': 'Invalid lastdate format. Please use dd-mm-yyyy.'}), 400
-    
-    today = datetime.now()
-    days_left = (lastdate_obj - today).days
-
-    # Calculate how many more code_track (2 points) can be done before the lastdate
-    # Each day, the user can complete a code_track (2 points) and 1 DC (2 points)
-    points_per_day = 2 + 2  # 2 points for code_track and 2 points for DC
-    total_points_left = days_left * points_per_day
-
-    # Calculate required points to complete before the lastdate
-    points_to_complete = profile_data['required_points'] - profile_data['points']
-
-    if total_points_left >= points_to_complete:
-        profile_data['status'] = 'On Track to Complete'
-        profile_data['estimated_completion_date'] = lastdate
-    else:
-        profile_data['status'] = 'Not on Track'
-        profile_data['estimated_completion_date'] = today.strftime('%d-%m-%Y')
 
     # Return the data as a JSON response
     return jsonify(profile_data)
@@ -152,11 +210,218 @@ def get_points():
     if not url.startswith("http"):
         return jsonify({'error': 'Invalid URL provided'}), 400
 
-    # Scrape the data (replace with your actual scraping function)
-    data = scrape_skillrack_profile(url)
+    # Scrape the data (or serve it from the cache)
+    data = get_profile_limited(url)
+
+    # Return the data as a JSON response, or 304 if the client sent the current ETag
+    return profile_response(data)
+
+
+# Validate a batch request body, returning (urls, invalid, error_response)
+def parse_batch_request(request_data, max_urls=BATCH_MAX_URLS):
+    if not request_data or not isinstance(request_data.get('urls'), list) or not request_data['urls']:
+        return None, None, (jsonify({'error': 'A non-empty list of URLs is required'}), 400)
+    if len(request_data['urls']) > max_urls:
+        return None, None, (jsonify({'error': f'At most {max_urls} URLs are allowed per batch'}), 400)
+
+    urls = []
+    invalid = {}
+    for raw_url in request_data['urls']:
+        url = unquote(raw_url) if isinstance(raw_url, str) else ''
+        if url.startswith("http"):
+            urls.append(url)
+        else:
+            invalid[str(raw_url)] = 'Invalid URL provided'
+    return urls, invalid, None
+
+
+# Define the API endpoint to scrape many profiles concurrently in one request
+@app.route('/api/points/batch', methods=['POST'])
+def get_points_batch():
+    urls, errors, error_response = parse_batch_request(request.get_json())
+    if error_response:
+        return error_response
+    client = limit_multi_profile_request()
+
+    results = {}
+    for url, data, error in fetch_many(urls, lambda url: get_profile(url, client)):
+        if error is None:
+            results[url] = data
+        else:
+            errors[url] = error
+
+    with stage('serialize'):
+        return json_bytes_response(b'{"errors":' + dumps(errors) + b',"results":' + dumps_profiles(results) + b'}')
+
+
+# Same as the batch endpoint, but emits one NDJSON line per profile as soon as it is ready
+@app.route('/api/points/batch/stream', methods=['POST'])
+def get_points_batch_stream():
+    urls, invalid, error_response = parse_batch_request(request.get_json())
+    if error_response:
+        return error_response
+    client = limit_multi_profile_request()
+
+    def generate():
+        for url, error in invalid.items():
+            yield dumps({'url': url, 'error': error}) + b'\n'
+        for url, data, error in fetch_many(urls, lambda url: get_profile(url, client)):
+            if error is None:
+                yield b'{"url":' + dumps(url) + b',"data":' + data.json_bytes() + b'}\n'
+            else:
+                yield dumps({'url': url, 'error': error}) + b'\n'
+
+    return Response(generate(), mimetype='application/x-ndjson')
+
+
+# Define the API endpoint to inspect the background refresher, or register profiles to pre-warm
+@app.route('/api/refresher', methods=['GET', 'POST'])
+def refresher_status():
+    if profile_refresher is None:
+        return jsonify({'error': 'Background refresh is not enabled'}), 404
+    if request.method == 'POST':
+        urls, invalid, error_response = parse_batch_request(request.get_json())
+        if error_response:
+            return error_response
+        for url in urls:
+            profile_refresher.touch(normalize_profile_key(url), url, prefetch=True)
+        return jsonify({'registered': len(urls), 'errors': invalid, **profile_refresher.status()})
+    return jsonify(profile_refresher.status())
+
+
+# Define the API endpoint to save a named group of profiles (e.g. a class section)
+@app.route('/api/groups', methods=['POST'])
+def save_group():
+    request_data = request.get_json()
+    if not store_enabled():
+        return jsonify({'error': 'Groups need the snapshot store to be enabled'}), 404
+    if not request_data or not isinstance(request_data.get('group'), str) or not request_data['group']:
+        return jsonify({'error': 'A group name is required'}), 400
+
+    urls, invalid, error_response = parse_batch_request(request_data, COHORT_MAX_PROFILES)
+    if error_response:
+        return error_response
+    snapshot_store.save_group(request_data['group'], urls)
+    return jsonify({'group': request_data['group'], 'count': len(urls), 'errors': invalid})
+
+
+# A stored group can stand in for the list of URLs; returns (request_data, error_response)
+def resolve_group(request_data):
+    if 'group' in request_data and 'urls' not in request_data:
+        stored = snapshot_store.load_group(request_data['group']) if store_enabled() else None
+        if stored is None:
+            return None, (jsonify({'error': 'Unknown group'}), 404)
+        return {**request_data, 'urls': stored}, None
+    return request_data, None
+
+
+# Define the API endpoint to rank a whole group and project who will finish by the lastdate
+@app.route('/api/cohort', methods=['POST'])
+def get_cohort():
+    request_data = request.get_json()
+    if not request_data or 'lastdate' not in request_data:
+        return jsonify({'error': 'lastdate and either urls or group are required'}), 400
+
+    request_data, error_response = resolve_group(request_data)
+    if error_response:
+        return error_response
+    urls, errors, error_response = parse_batch_request(request_data, COHORT_MAX_PROFILES)
+    if error_response:
+        return error_response
+
+    points_per_day = request_data.get('points_per_day', DEFAULT_POINTS_PER_DAY)
+    if not isinstance(points_per_day, (int, float)) or points_per_day <= 0:
+        return jsonify({'error': 'points_per_day must be a positive number'}), 400
+    try:
+        datetime.strptime(request_data['lastdate'], '%d-%m-%Y')
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid lastdate format. Please use dd-mm-yyyy.'}), 400
 
-    # Return the data as a JSON response
-    return jsonify(data)
+    client = limit_multi_profile_request()
+    profiles = []
+    for url, data, error in fetch_many(urls, lambda url: get_profile(url, client)):
+        if error is None:
+            profiles.append(data)
+        else:
+            errors[url] = error
+
+    cohort = compute_cohort(profiles, request_data['lastdate'], points_per_day)
+    cohort['errors'] = errors
+    return jsonify(cohort)
+
+
+# Define the API endpoint for dashboards to poll only the profiles whose counters moved since
+# their last poll (no upstream fetch); pass the returned version back as `since` next time
+@app.route('/api/points/changes', methods=['POST'])
+def get_changes():
+    request_data = request.get_json()
+    if not store_enabled():
+        return jsonify({'error': 'Change tracking needs the snapshot store to be enabled'}), 404
+    if not request_data:
+        return jsonify({'error': 'Either urls or group is required'}), 400
+
+    request_data, error_response = resolve_group(request_data)
+    if error_response:
+        return error_response
+    urls, errors, error_response = parse_batch_request(request_data, COHORT_MAX_PROFILES)
+    if error_response:
+        return error_response
+
+    since = request_data.get('since')
+    if isinstance(since, bool) or not isinstance(since, (int, str, type(None))):
+        return jsonify({'error': 'since must be a version number or a yyyy-mm-dd [HH:MM:SS] timestamp'}), 400
+    if isinstance(since, str):
+        try:
+            validate_day(since)
+        except ValueError:
+            return jsonify({'error': 'since must be a version number or a yyyy-mm-dd [HH:MM:SS] timestamp'}), 400
+
+    keys = {normalize_profile_key(url): url for url in urls}
+    if profile_refresher is not None:
+        # Polled profiles are the ones worth keeping fresh
+        for key, url in keys.items():
+            profile_refresher.touch(key, url)
+    version, changed = snapshot_store.changes(keys, since)
+    changes = [{'url': keys[key], **row} for key, row in changed.items()]
+    changes.sort(key=lambda change: change['version'])
+    return jsonify({'version': version, 'changes': changes, 'errors': errors})
+
+
+# Validate a history request body, returning (profile_key, since, until, error_response)
+def parse_history_request(request_data):
+    if not store_enabled():
+        return None, None, None, (jsonify({'error': 'Profile history is not enabled'}), 404)
+    if not request_data or 'url' not in request_data:
+        return None, None, None, (jsonify({'error': 'No URL provided in the request body'}), 400)
+
+    url = unquote(request_data['url'])
+    if not url.startswith("http"):
+        return None, None, None, (jsonify({'error': 'Invalid URL provided'}), 400)
+
+    try:
+        since = validate_day(request_data.get('since'))
+        until = validate_day(request_data.get('until'))
+    except (TypeError, ValueError):
+        return None, None, None, (jsonify({'error': 'Invalid since/until format. Please use yyyy-mm-dd.'}), 400)
+    return normalize_profile_key(url), since, until, None
+
+
+# Define the API endpoint to list the recorded snapshots of a profile (no upstream fetch)
+@app.route('/api/history', methods=['POST'])
+def get_history():
+    profile_key, since, until, error_response = parse_history_request(request.get_json())
+    if error_response:
+        return error_response
+    return jsonify({'profile_key': profile_key, 'snapshots': snapshot_store.history(profile_key, since, until)})
+
+
+# Define the API endpoint to report per-day progress of a profile (no upstream fetch)
+@app.route('/api/history/daily', methods=['POST'])
+def get_daily_history():
+    profile_key, since, until, error_response = parse_history_request(request.get_json())
+    if error_response:
+        return error_response
+    return jsonify({'profile_key': profile_key, 'days': snapshot_store.daily_deltas(profile_key, since, until)})
 
 # if __name__ == '__main__':
 #     app.run(debug=True)
@@ -0,0 +1,263 @@
+import asyncio
+import os
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+from api import MAX_BODY_BYTES, encode_response, error_response, parse_json_body, points_request, track_request, track_response
+from breaker import UpstreamUnavailable
+from cache import profile_cache, normalize_profile_key
+from fetch import STREAM_EXTRACT, close_async_client, fetch_extracted_async, fetch_page_async
+from parsers import extract_profile
+from push import PUSH_FIELDS, STREAM_HEARTBEAT, STREAM_MAX_PROFILES, STREAM_SEND_TIMEOUT, update_hub
+from records import ProfileRecord, dumps
+from scrape import add_track_status, profile_from_extracted, profile_refresher, profile_scraper
+from singleflight import profile_flight
+from snapshots import record_snapshot
+
+# Async serving mode: same routes and JSON as app.py, but upstream waits don't hold a worker.
+#   uvicorn asgi:app --workers 2
+#   gunicorn asgi:app -k uvicorn.workers.UvicornWorker
+# The two profile routes (and the /api/points/stream push route) are served natively on the
+# event loop; every other route of app.py (batch, cohort, history, groups, metrics, ...) runs the
+# Flask app itself on a thread pool through uvicorn's WSGI adapter.
+# Parsing is CPU-bound, so it runs in an executor ('thread' or 'process') off the event loop.
+PARSE_EXECUTOR = os.environ.get('ASGI_PARSE_EXECUTOR', 'thread')
+PARSE_WORKERS = int(os.environ.get('ASGI_PARSE_WORKERS', os.cpu_count() or 2))
+# Threads running the Flask routes
+WSGI_WORKERS = int(os.environ.get('ASGI_WSGI_WORKERS', 10))
+
+_executor = None
+_flask_app = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        if PARSE_EXECUTOR == 'process':
+            _executor = ProcessPoolExecutor(max_workers=PARSE_WORKERS)
+        else:
+            _executor = ThreadPoolExecutor(max_workers=PARSE_WORKERS, thread_name_prefix='parse')
+    return _executor
+
+
+async def scrape_skillrack_profile_async(url):
+    if STREAM_EXTRACT:
+        # The stream parser only tokenizes the top of the page, cheap enough to run on the loop
+        return profile_from_extracted(url, await fetch_extracted_async(url, profile_scraper.stat_extractors))
+    loop = asyncio.get_running_loop()
+    extract = lambda html: loop.run_in_executor(get_executor(), extract_profile, html)
+    return profile_from_extracted(url, await fetch_page_async(url, extract))
+
+
+async def fetch_profile(key, url):
+    profile_data = await scrape_skillrack_profile_async(url)
+    await asyncio.get_running_loop().run_in_executor(None, record_snapshot, key, profile_data)
+    update_hub.publish(key, profile_data)
+    if profile_refresher is not None:
+        profile_refresher.mark_fetched(key)
+    return profile_data
+
+
+async def get_profile(url):
+    key = normalize_profile_key(url)
+    if profile_refresher is not None:
+        profile_refresher.touch(key, url)
+    try:
+        return await profile_cache.aget_or_fetch(key, lambda: profile_flight.ado(key, lambda: fetch_profile(key, url)))
+    except UpstreamUnavailable:
+        cached = profile_cache.last_known(key)
+        if cached is None:
+            raise
+        return cached.as_stale()
+
+
+async def get_points(request_data):
+    url, error = points_request(request_data)
+    if error:
+        return error
+    return 200, await get_profile(url)
+
+
+async def track_with_buddy(request_data):
+    url, lastdate, error = track_request(request_data)
+    if error:
+        return error
+    return track_response(await get_profile(url), lastdate)
+
+
+# Server-sent events for dashboards: GET /api/points/stream?url=...&url=...[&lastdate=dd-mm-yyyy]
+# first sends what is cached for each profile, then an event whenever a scrape (usually the
+# background refresh) changes its PUSH_FIELDS counters or, with lastdate, its on-track status.
+# Each event is {"url": ..., "data": profile} like the batch stream. Idle streams cost one
+# coroutine, so a process holds thousands of them.
+async def stream_profiles(scope, receive, send):
+    params = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    urls = list(dict.fromkeys(params.get('url', [])))
+    lastdate = params.get('lastdate', [None])[0]
+    if not urls:
+        await send_json(send, 400, {'error': 'At least one url query parameter is required'})
+        return
+    if len(urls) > STREAM_MAX_PROFILES:
+        await send_json(send, 400, {'error': f'At most {STREAM_MAX_PROFILES} URLs are allowed per stream'})
+        return
+    if not all(url.startswith("http") for url in urls):
+        await send_json(send, 400, {'error': 'Invalid URL provided'})
+        return
+    if lastdate is not None:
+        try:
+            datetime.strptime(lastdate, '%d-%m-%Y')
+        except ValueError:
+            await send_json(send, 400, {'error': 'Invalid lastdate format. Please use dd-mm-yyyy.'})
+            return
+
+    keys = {normalize_profile_key(url): url for url in urls}
+    loop = asyncio.get_running_loop()
+    wake = asyncio.Event()
+    subscription = update_hub.subscribe(keys, lambda: loop.call_soon_threadsafe(wake.set))
+    if subscription is None:
+        await send_json(send, 503, {'error': 'Too many open streams, retry later'}, [('Retry-After', '5')])
+        return
+
+    disconnected = False
+
+    async def watch_disconnect():
+        nonlocal disconnected
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+        disconnected = True
+        wake.set()
+
+    watcher = asyncio.ensure_future(watch_disconnect())
+    sent = {}
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [(b'content-type', b'text/event-stream'), (b'cache-control', b'no-cache'), (b'x-accel-buffering', b'no')],
+        })
+        for key, url in keys.items():
+            cached = profile_cache.last_known(key)
+            if cached is not None:
+                update_hub.offer(subscription, key, cached)
+            if profile_refresher is not None:
+                # Streamed profiles are kept fresh by the background refresh; uncached ones right away
+                profile_refresher.touch(key, url, prefetch=cached is None)
+
+        while not disconnected:
+            try:
+                await asyncio.wait_for(wake.wait(), STREAM_HEARTBEAT)
+            except asyncio.TimeoutError:
+                events = [b': keepalive\n\n']
+            else:
+                wake.clear()
+                events = []
+                for key, record in update_hub.take(subscription).items():
+                    event = stream_event(key, keys[key], record, lastdate, sent)
+                    if event is not None:
+                        events.append(event)
+            if events and not disconnected:
+                # Backpressure: while the client reads slowly, newer records replace older ones in
+                # its mailbox; a client that takes nothing for STREAM_SEND_TIMEOUT is dropped
+                await asyncio.wait_for(send({'type': 'http.response.body', 'body': b''.join(events), 'more_body': True}),
+                                       STREAM_SEND_TIMEOUT)
+    except (asyncio.TimeoutError, OSError):
+        pass
+    finally:
+        update_hub.unsubscribe(subscription)
+        watcher.cancel()
+
+
+def stream_event(key, url, record, lastdate, sent):
+    # Encoded event, or None when nothing the subscriber watches changed since its last event
+    data = record
+    state = tuple(record.get(name) for name in PUSH_FIELDS)
+    if lastdate is not None:
+        data = add_track_status(record.to_dict(), lastdate)
+        state += (data['status'],)
+    if sent.get(key) == state:
+        return None
+    sent[key] = state
+    body = data.json_bytes() if isinstance(data, ProfileRecord) else dumps(data)
+    return b'event: profile\ndata: {"url":' + dumps(url) + b',"data":' + body + b'}\n\n'
+
+
+ROUTES = {
+    '/api/points': get_points,
+    '/api/trackwithbuddy': track_with_buddy,
+}
+
+
+def flask_app():
+    # app.py is only imported once a route served by it is requested
+    global _flask_app
+    if _flask_app is None:
+        from uvicorn.middleware.wsgi import WSGIMiddleware
+        from app import app as full_app
+        _flask_app = WSGIMiddleware(full_app, workers=WSGI_WORKERS)
+    return _flask_app
+
+
+async def read_json(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if len(body) > MAX_BODY_BYTES:
+            return None
+        if not message.get('more_body'):
+            break
+    return parse_json_body(body)
+
+
+def request_header(scope, name):
+    for key, value in scope.get('headers', ()):
+        if key == name:
+            return value.decode('latin-1')
+    return None
+
+
+async def send_json(send, status, data, headers=(), if_none_match=None):
+    status, headers, body = encode_response(status, data, if_none_match, headers)
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await close_async_client()
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+
+    if scope['path'] == '/api/points/stream' and scope['method'] == 'GET':
+        await stream_profiles(scope, receive, send)
+        return
+    handler = ROUTES.get(scope['path'])
+    if handler is None or scope['method'] != 'POST':
+        await flask_app()(scope, receive, send)
+        return
+
+    headers = []
+    try:
+        status, data = await handler(await read_json(receive))
+    except Exception as e:
+        status, data, headers = error_response(e)
+    await send_json(send, status, data, headers, request_header(scope, b'if-none-match'))
@@ -0,0 +1,55 @@
+import os
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlparse
+
+# Upper bounds for batch scraping, overridable from the environment
+BATCH_MAX_URLS = int(os.environ.get('BATCH_MAX_URLS', 500))
+BATCH_MAX_WORKERS = int(os.environ.get('BATCH_MAX_WORKERS', 16))
+BATCH_PER_HOST = int(os.environ.get('BATCH_PER_HOST', 8))
+# URLs one batch keeps in the shared pool at a time, so a large batch (or cohort) only holds its
+# share of the workers and another client's batch starts right away instead of queueing behind it
+BATCH_PER_REQUEST = int(os.environ.get('BATCH_PER_REQUEST', max(1, BATCH_MAX_WORKERS // 2)))
+
+_executor = ThreadPoolExecutor(max_workers=BATCH_MAX_WORKERS, thread_name_prefix='batch')
+_host_limits = {}
+_host_limits_lock = threading.Lock()
+
+
+def _host_semaphore(url):
+    host = urlparse(url).netloc.lower()
+    with _host_limits_lock:
+        semaphore = _host_limits.get(host)
+        if semaphore is None:
+            semaphore = _host_limits[host] = threading.BoundedSemaphore(BATCH_PER_HOST)
+    return semaphore
+
+
+def _fetch_limited(fetch, url):
+    with _host_semaphore(url):
+        return fetch(url)
+
+
+def fetch_many(urls, fetch, window=None):
+    # Yields (url, result, error) in completion order; exactly one of result/error is set.
+    # At most `window` URLs are submitted at a time, the next one as each finishes
+    window = window or BATCH_PER_REQUEST
+    pending = deque(dict.fromkeys(urls))
+    futures = {}
+    try:
+        while pending or futures:
+            while pending and len(futures) < window:
+                url = pending.popleft()
+                futures[_executor.submit(_fetch_limited, fetch, url)] = url
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                url = futures.pop(future)
+                try:
+                    yield url, future.result(), None
+                except Exception as e:
+                    yield url, None, str(e) or e.__class__.__name__
+    finally:
+        # A caller that stops early (e.g. a stream client that went away) leaves nothing queued
+        for future in futures:
+            future.cancel()
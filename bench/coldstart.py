@@ -0,0 +1,178 @@
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from bench.run import git_revision, percentile
+from bench.standin import start_standin
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENTRIES = ('serverless', 'app', 'index')
+
+# Runs in a fresh interpreter: imports one entry module, then sends it a profile request
+# straight through WSGI (no server in between) and reports the timings as JSON
+CHILD = r'''
+import io, json, sys, time
+started = time.perf_counter()
+import {module} as entry
+imported = time.perf_counter()
+
+def call(environ):
+    statuses = []
+    body = b''.join(entry.app(environ, lambda status, headers, exc_info=None: statuses.append(status)))
+    return statuses[0], body
+
+def environ(profile_url):
+    if {module!r} == 'index':
+        from urllib.parse import quote
+        return {{'REQUEST_METHOD': 'GET', 'PATH_INFO': '/api/points/' + quote(profile_url, safe=':/'),
+                 'QUERY_STRING': '', 'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'wsgi.url_scheme': 'http',
+                 'wsgi.input': io.BytesIO(b''), 'wsgi.errors': sys.stderr}}
+    body = json.dumps({{'url': profile_url}}).encode()
+    return {{'REQUEST_METHOD': 'POST', 'PATH_INFO': '/api/points', 'QUERY_STRING': '', 'SERVER_NAME': 'localhost',
+             'SERVER_PORT': '80', 'wsgi.url_scheme': 'http', 'CONTENT_TYPE': 'application/json',
+             'CONTENT_LENGTH': str(len(body)), 'wsgi.input': io.BytesIO(body), 'wsgi.errors': sys.stderr}}
+
+status, body = call(environ({profile_url!r}))
+first = time.perf_counter()
+call(environ({profile_url!r}))
+second = time.perf_counter()
+print(json.dumps({{
+    'import_ms': (imported - started) * 1000,
+    'first_response_ms': (first - imported) * 1000,
+    'second_response_ms': (second - first) * 1000,
+    'status': status,
+    'modules': len(sys.modules),
+    'loaded': sorted(name for name in ('flask', 'requests', 'bs4', 'asyncio', 'sqlite3') if name in sys.modules),
+}}))
+'''
+
+IMPORTTIME_PATTERN = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+def run_child(module, profile_url, env):
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, '-c', CHILD.format(module=module, profile_url=profile_url)],
+                            cwd=ROOT, env=env, capture_output=True, text=True)
+    wall = time.perf_counter() - started
+    if result.returncode != 0:
+        raise RuntimeError(f'{module} failed:\n{result.stderr}')
+    sample = json.loads(result.stdout.strip().splitlines()[-1])
+    sample['process_ms'] = wall * 1000
+    return sample
+
+
+def interpreter_baseline(env):
+    started = time.perf_counter()
+    subprocess.run([sys.executable, '-c', 'pass'], cwd=ROOT, env=env, check=True)
+    return (time.perf_counter() - started) * 1000
+
+
+def import_profile(module, env, top):
+    # -X importtime for one import of the module: the heaviest imports by their own time, and the
+    # module's direct imports by cumulative time (what making one of them lazy would save)
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=ROOT, env=env, capture_output=True, text=True)
+    entries = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_PATTERN.match(line)
+        if match:
+            entries.append((match.group(4), len(match.group(3)), int(match.group(1)), int(match.group(2))))
+    # Children are printed before their parent, so the module's block ends at its own line
+    end = next((i for i, entry in enumerate(entries) if entry[0] == module), len(entries))
+    start = end
+    while start > 0 and entries[start - 1][1] > entries[end][1]:
+        start -= 1
+    direct = [(name, cumulative) for name, depth, _, cumulative in entries[start:end] if depth == entries[end][1] + 2]
+    return {
+        'heaviest_self_ms': {name: self_us / 1000 for name, _, self_us, _ in sorted(entries, key=lambda e: -e[2])[:top]},
+        'direct_imports_ms': {name: cumulative / 1000 for name, cumulative in sorted(direct, key=lambda e: -e[1])[:top]},
+    }
+
+
+def summarize(samples):
+    summary = {}
+    for key in ('process_ms', 'import_ms', 'first_response_ms', 'second_response_ms'):
+        values = [sample[key] for sample in samples]
+        summary[key] = {'p50': percentile(values, 50), 'max': max(values)}
+    summary['status'] = samples[-1]['status']
+    summary['modules'] = samples[-1]['modules']
+    summary['loaded'] = samples[-1]['loaded']
+    return summary
+
+
+def build_warm_cache(path, profile_url, env):
+    subprocess.run([sys.executable, '-c', f'import serverless; serverless.build_warm_cache({path!r}, [{profile_url!r}])'],
+                   cwd=ROOT, env=env, check=True, capture_output=True)
+
+
+# Cold-start cost of each entry point, as a serverless platform sees it: every run is a fresh
+# interpreter that imports the module and answers one profile request (scraped from an in-process
+# stand-in, so no network), then a second one. With the warm cache, serverless.py restores a
+# snapshot at import and answers the first request from it.
+#   python -m bench.coldstart
+#   python -m bench.coldstart --entries serverless --runs 20 --output coldstart.json
+def main():
+    parser = argparse.ArgumentParser(description='Measure import time and time-to-first-response of fresh processes')
+    parser.add_argument('--entries', default=','.join(ENTRIES), help='entry modules to measure')
+    parser.add_argument('--runs', type=int, default=5, help='fresh processes per entry')
+    parser.add_argument('--top', type=int, default=10, help='imports to list per entry')
+    parser.add_argument('--no-warm-cache', action='store_true', help='skip the serverless.py run with WARM_CACHE_FILE')
+    parser.add_argument('--output', help='also write the JSON report here')
+    args = parser.parse_args()
+
+    entries = [entry for entry in args.entries.split(',') if entry]
+    unknown = set(entries) - set(ENTRIES)
+    if unknown:
+        parser.error(f'unknown entries: {", ".join(sorted(unknown))}')
+
+    standin, standin_url = start_standin()
+    profile_url = f'{standin_url}/profile/1/typical'
+    workdir = tempfile.mkdtemp(prefix='skillrack-coldstart-')
+    # No snapshot database, refresher or shared cache: every process starts from nothing
+    env = dict(os.environ, SNAPSHOT_DB='', REFRESHER_ENABLED='0', PROFILE_CACHE_BACKEND='memory')
+    env.pop('WARM_CACHE_FILE', None)
+
+    runs = [(entry, entry, env) for entry in entries]
+    if 'serverless' in entries and not args.no_warm_cache:
+        warm_cache = os.path.join(workdir, 'warm_cache.jsonl')
+        build_warm_cache(warm_cache, profile_url, env)
+        runs.append(('serverless+warm_cache', 'serverless', dict(env, WARM_CACHE_FILE=warm_cache)))
+
+    report = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'python': sys.version.split()[0],
+        'interpreter_ms': percentile([interpreter_baseline(env) for _ in range(args.runs)], 50),
+        'entries': {},
+    }
+    try:
+        for label, module, run_env in runs:
+            samples = [run_child(module, profile_url, run_env) for _ in range(args.runs)]
+            report['entries'][label] = summarize(samples)
+            if label == module:
+                report['entries'][label]['imports'] = import_profile(module, run_env, args.top)
+    finally:
+        standin.shutdown()
+
+    print(f'\ninterpreter startup {report["interpreter_ms"]:.1f} ms (p50 of {args.runs})', file=sys.stderr)
+    print(f'{"entry":<22} {"process":>9} {"import":>9} {"1st resp":>9} {"2nd resp":>9} {"modules":>8}  loaded', file=sys.stderr)
+    for label, summary in report['entries'].items():
+        print(f'{label:<22} {summary["process_ms"]["p50"]:>9.1f} {summary["import_ms"]["p50"]:>9.1f} '
+              f'{summary["first_response_ms"]["p50"]:>9.1f} {summary["second_response_ms"]["p50"]:>9.1f} '
+              f'{summary["modules"]:>8}  {",".join(summary["loaded"])}', file=sys.stderr)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,205 @@
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import quote
+
+import requests
+from werkzeug.serving import make_server
+
+from bench.run import QuietRequestHandler, git_revision, percentile
+from bench.standin import add_behaviour_arguments, behaviour_from_args, start_standin
+
+ENDPOINTS = ('points', 'track', 'index')
+
+
+def build_requests(endpoint, app_url, index_url):
+    # Returns send(session, profile_url, timeout) -> HTTP status for one endpoint
+    if endpoint == 'points':
+        return lambda session, url, timeout: session.post(f'{app_url}/api/points', json={'url': url}, timeout=timeout).status_code
+    if endpoint == 'track':
+        body = lambda url: {'url': url, 'lastdate': '30-04-2030'}
+        return lambda session, url, timeout: session.post(f'{app_url}/api/trackwithbuddy', json=body(url), timeout=timeout).status_code
+    return lambda session, url, timeout: session.get(f'{index_url}/api/points/{quote(url, safe=":/")}', timeout=timeout).status_code
+
+
+def profile_picker(standin_url, profiles, zipf):
+    # Zipf-weighted choice over `profiles` distinct links (zipf=0 is uniform), like a class where
+    # a few students check their progress far more often than the rest
+    urls = [f'{standin_url}/profile/{i}/key{i}' for i in range(1, profiles + 1)]
+    weights = [1 / (rank ** zipf) for rank in range(1, profiles + 1)]
+    rng = random.Random(42)
+    lock = threading.Lock()
+
+    def pick():
+        with lock:
+            return rng.choices(urls, weights)[0]
+    return pick
+
+
+def run_level(send, pick, rps, duration, max_in_flight, timeout):
+    # Open loop: request i is due at start + i / rps no matter how earlier requests are doing, and its
+    # latency counts from that due time, so client-side queueing behind a slow server is included
+    results = []
+    lock = threading.Lock()
+    local = threading.local()
+
+    def task(scheduled, url):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        try:
+            status = send(session, url, timeout)
+        except requests.Timeout:
+            status = 'timeout'
+        except requests.RequestException:
+            status = 'connection_error'
+        finished = time.perf_counter()
+        with lock:
+            results.append((finished - scheduled, status))
+
+    total = max(1, int(rps * duration))
+    executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix='load')
+    start = time.perf_counter() + 0.05
+    for i in range(total):
+        scheduled = start + i / rps
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        executor.submit(task, scheduled, pick())
+    executor.shutdown(wait=True)
+    elapsed = time.perf_counter() - start
+
+    latencies = [latency for latency, _ in results]
+    ok = [latency for latency, status in results if status == 200]
+    statuses = {}
+    for _, status in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        'offered_rps': rps,
+        'sent': total,
+        'ok': len(ok),
+        'statuses': statuses,
+        'throughput_rps': len(results) / elapsed,
+        'goodput_rps': len(ok) / elapsed,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p90_ms': percentile(latencies, 90) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'max_ms': max(latencies) * 1000,
+    }
+
+
+def is_saturated(level, slo_ms):
+    # The server stopped keeping up: it sheds/fails work or tail latency blows through the SLO
+    return level['goodput_rps'] < 0.9 * level['offered_rps'] or level['p99_ms'] > slo_ms
+
+
+def start_local_servers(use_cache):
+    # In-process app.py and index.py on threaded werkzeug servers
+    import app as app_module
+    import index as index_module
+
+    # One load generator stands in for many users, so per-client rate limiting stays off
+    app_module.RATE_LIMIT_ENABLED = False
+    if not use_cache:
+        app_module.profile_cache.ttl = 0
+    servers = []
+    urls = []
+    for module in (app_module, index_module):
+        server = make_server('127.0.0.1', 0, module.app, threaded=True, request_handler=QuietRequestHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        urls.append(f'http://127.0.0.1:{server.server_port}')
+    return servers, urls[0], urls[1], app_module
+
+
+def print_table(endpoint, levels, slo_ms, out):
+    print(f'\n{endpoint}', file=out)
+    print(f'{"offered":>8} {"goodput":>8} {"p50 ms":>8} {"p90 ms":>8} {"p99 ms":>9} {"max ms":>9}  statuses', file=out)
+    for level in levels:
+        marker = '  <- saturated' if is_saturated(level, slo_ms) else ''
+        print(f'{level["offered_rps"]:>8g} {level["goodput_rps"]:>8.1f} {level["p50_ms"]:>8.1f} {level["p90_ms"]:>8.1f} '
+              f'{level["p99_ms"]:>9.1f} {level["max_ms"]:>9.1f}  {level["statuses"]}{marker}', file=out)
+
+
+# Saturation curves for the profile endpoints against a simulated Skillrack, all on one box.
+# By default the stand-in, app.py and index.py run in this process; point --app-url/--index-url
+# (and --standin-url) at separately started servers to measure e.g. gunicorn worker settings:
+#   python -m bench.load --rps 10,25,50,100 --latency lognormal:0.3,0.6 --error-rate 0.02
+#   python -m bench.load --app-url http://127.0.0.1:8000 --standin-url http://127.0.0.1:8081 --endpoints points
+def main():
+    parser = argparse.ArgumentParser(description='Open-loop load test of the profile endpoints at target request rates')
+    parser.add_argument('--rps', default='5,10,25,50,100', help='comma-separated request rates to step through')
+    parser.add_argument('--duration', type=float, default=10, help='seconds per rate')
+    parser.add_argument('--endpoints', default=','.join(ENDPOINTS), help='any of points (POST /api/points), track (POST /api/trackwithbuddy), index (GET index.py route)')
+    parser.add_argument('--profiles', type=int, default=200, help='distinct profile links to request')
+    parser.add_argument('--zipf', type=float, default=1.0, help='popularity skew across profiles (0 = uniform)')
+    parser.add_argument('--max-in-flight', type=int, default=256, help='client threads; requests beyond this queue in the client')
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--slo-ms', type=float, default=1000, help='p99 latency above which a rate counts as saturated')
+    parser.add_argument('--keep-going', action='store_true', help='keep increasing the rate after an endpoint saturates')
+    parser.add_argument('--app-url', help='running app.py server (default: start one in-process)')
+    parser.add_argument('--index-url', help='running index.py server (default: start one in-process)')
+    parser.add_argument('--standin-url', help='running stand-in (default: start one in-process with the options below)')
+    parser.add_argument('--no-cache', action='store_true', help='disable the profile cache of the in-process app')
+    parser.add_argument('--output', help='also write the JSON report here')
+    add_behaviour_arguments(parser)
+    args = parser.parse_args()
+
+    endpoints = [endpoint for endpoint in args.endpoints.split(',') if endpoint]
+    unknown = set(endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f'unknown endpoints: {", ".join(sorted(unknown))}')
+    rates = [float(rate) for rate in args.rps.split(',') if rate]
+
+    standin = None
+    standin_url = args.standin_url
+    if not standin_url:
+        standin, standin_url = start_standin(behaviour=behaviour_from_args(args))
+    servers, app_url, index_url, app_module = [], args.app_url, args.index_url, None
+    if not app_url or not index_url:
+        servers, local_app_url, local_index_url, app_module = start_local_servers(not args.no_cache)
+        app_url = app_url or local_app_url
+        index_url = index_url or local_index_url
+
+    pick = profile_picker(standin_url, args.profiles, args.zipf)
+    report = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'settings': {key: value for key, value in vars(args).items() if key != 'output'},
+        'endpoints': {},
+    }
+    try:
+        for endpoint in endpoints:
+            send = build_requests(endpoint, app_url, index_url)
+            levels = []
+            for rate in rates:
+                if app_module is not None:
+                    # Every rate starts cold, so levels are comparable
+                    app_module.profile_cache.clear()
+                level = run_level(send, pick, rate, args.duration, args.max_in_flight, args.timeout)
+                levels.append(level)
+                if is_saturated(level, args.slo_ms) and not args.keep_going:
+                    break
+            sustained = [level['offered_rps'] for level in levels if not is_saturated(level, args.slo_ms)]
+            report['endpoints'][endpoint] = {'max_sustained_rps': max(sustained) if sustained else None, 'levels': levels}
+            print_table(endpoint, levels, args.slo_ms, sys.stderr)
+    finally:
+        for server in servers:
+            server.shutdown()
+        if standin is not None:
+            standin.shutdown()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
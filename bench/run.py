@@ -0,0 +1,177 @@
+import argparse
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+from bench.standin import FIXTURES_DIR, load_pages, start_standin
+
+# Pages that every scraper can turn into profile_data
+ENDPOINT_FIXTURES = ['typical', 'new_student', 'large', 'entities']
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    disable_nagle_algorithm = True
+
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return None
+    # Nearest-rank percentile
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def bench_parse(iterations):
+    from parsers import ENGINES
+
+    results = {}
+    for name, body in load_pages().items():
+        html = body.decode('utf-8')
+        results[name] = {'bytes': len(body)}
+        for engine, extract in ENGINES.items():
+            extract(html)
+            timings = []
+            for _ in range(iterations):
+                start = time.perf_counter()
+                extract(html)
+                timings.append(time.perf_counter() - start)
+
+            tracemalloc.start()
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            extract(html)
+            peak = tracemalloc.get_traced_memory()[1] - before
+            tracemalloc.stop()
+
+            results[name][engine] = {
+                'median_ms': statistics.median(timings) * 1000,
+                'min_ms': min(timings) * 1000,
+                'peak_alloc_bytes': peak,
+            }
+    return results
+
+
+def run_load(url, bodies, concurrency, duration):
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(worker_id):
+        nonlocal errors
+        session = requests.Session()
+        local = []
+        local_errors = 0
+        i = worker_id
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                response = session.post(url, json=bodies[i % len(bodies)], timeout=30)
+                if response.status_code != 200:
+                    local_errors += 1
+            except requests.RequestException:
+                local_errors += 1
+            local.append(time.perf_counter() - start)
+            i += concurrency
+        with lock:
+            latencies.extend(local)
+            errors += local_errors
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(worker, range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': len(latencies) / elapsed if elapsed else 0,
+        'p50_ms': percentile(latencies, 50) * 1000 if latencies else None,
+        'p95_ms': percentile(latencies, 95) * 1000 if latencies else None,
+        'p99_ms': percentile(latencies, 99) * 1000 if latencies else None,
+    }
+
+
+def bench_endpoints(concurrency_levels, duration, use_cache):
+    import app as app_module
+
+    # One load generator stands in for many users, so per-client rate limiting stays off
+    app_module.RATE_LIMIT_ENABLED = False
+    if not use_cache:
+        app_module.profile_cache.ttl = 0
+    standin, standin_url = start_standin()
+    server = make_server('127.0.0.1', 0, app_module.app, threaded=True, request_handler=QuietRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    app_url = f'http://127.0.0.1:{server.server_port}'
+
+    profile_urls = [f'{standin_url}/profile/{i}/{name}' for i, name in enumerate(ENDPOINT_FIXTURES, 1)]
+    endpoints = {
+        '/api/points': [{'url': url} for url in profile_urls],
+        '/api/trackwithbuddy': [{'url': url, 'lastdate': '30-04-2030'} for url in profile_urls],
+    }
+
+    results = {}
+    try:
+        for path, bodies in endpoints.items():
+            results[path] = [run_load(app_url + path, bodies, level, duration) for level in concurrency_levels]
+    finally:
+        server.shutdown()
+        standin.shutdown()
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Offline benchmarks; diff the JSON output of two runs to compare commits
+#   python -m bench.run [--output results.json] [--skip-endpoints]
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark profile parsing and API throughput against saved pages')
+    parser.add_argument('--iterations', type=int, default=50, help='parse iterations per page and engine')
+    parser.add_argument('--concurrency', default='1,4,16', help='comma-separated client concurrency levels')
+    parser.add_argument('--duration', type=float, default=5, help='seconds per endpoint and concurrency level')
+    parser.add_argument('--cache', action='store_true', help='keep the profile cache enabled during endpoint runs')
+    parser.add_argument('--skip-endpoints', action='store_true', help='only run the parse benchmarks')
+    parser.add_argument('--output', help='write JSON here instead of stdout')
+    args = parser.parse_args()
+
+    report = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'fixtures_dir': os.path.relpath(FIXTURES_DIR),
+        'parse': bench_parse(args.iterations),
+    }
+    if not args.skip_endpoints:
+        levels = [int(level) for level in args.concurrency.split(',') if level]
+        report['endpoints'] = bench_endpoints(levels, args.duration, args.cache)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
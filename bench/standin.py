@@ -0,0 +1,154 @@
+import argparse
+import hashlib
+import math
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'fixtures', 'profiles')
+# Fixture used to render pages for profile keys that are not fixture names
+TEMPLATE_FIXTURE = 'typical'
+
+COUNTER_PATTERN = re.compile(rb'(<i class="code icon"></i> )(\d+)')
+NAME_PATTERN = re.compile(rb'(<div class="ui big label black">)[^<]*(</div>)')
+
+
+def parse_latency(spec):
+    # 'none', 'fixed:S', 'uniform:LOW,HIGH', 'exp:MEAN' or 'lognormal:MEDIAN,SIGMA' (seconds)
+    kind, _, params = spec.partition(':')
+    values = [float(value) for value in params.split(',') if value]
+    if kind == 'none':
+        return lambda: 0.0
+    if kind == 'fixed':
+        return lambda: values[0]
+    if kind == 'uniform':
+        return lambda: random.uniform(values[0], values[1])
+    if kind == 'exp':
+        return lambda: random.expovariate(1 / values[0])
+    if kind == 'lognormal':
+        return lambda: random.lognormvariate(math.log(values[0]), values[1])
+    raise ValueError(f'Unknown latency distribution: {spec}')
+
+
+class Behaviour:
+    # How the stand-in misbehaves; shared by all requests and changeable while it runs
+
+    def __init__(self, latency='none', error_rate=0.0, error_status=503, drip_bytes=0, drip_interval=0.0):
+        self.latency_spec = latency
+        self.latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.drip_bytes = drip_bytes
+        self.drip_interval = drip_interval
+        self.served = 0
+        self.failed = 0
+
+
+def render_profile(template, profile_id, key):
+    # Deterministic per profile: the same link always gets the same name and counters
+    seed = int.from_bytes(hashlib.sha1(f'{profile_id}/{key}'.encode('utf-8')).digest()[:8], 'big')
+    rng = random.Random(seed)
+    body = NAME_PATTERN.sub(lambda m: m.group(1) + f'STUDENT {profile_id}'.encode('utf-8') + m.group(2), template, count=1)
+    return COUNTER_PATTERN.sub(lambda m: m.group(1) + str(rng.randint(0, 800)).encode(), body)
+
+
+# Serves saved profile pages at /profile/<id>/<fixture name without .html>, mirroring the
+# shape of real Skillrack profile links; any other key gets a page rendered from the template
+class StandinHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    pages = {}
+    behaviour = Behaviour()
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        parts = [part for part in self.path.split('?')[0].split('/') if part]
+        if len(parts) != 3 or parts[0] != 'profile':
+            self.send_error(404)
+            return
+        body = self.pages.get(parts[2])
+        if body is None and TEMPLATE_FIXTURE in self.pages:
+            body = render_profile(self.pages[TEMPLATE_FIXTURE], parts[1], parts[2])
+        if body is None:
+            self.send_error(404)
+            return
+
+        behaviour = self.behaviour
+        delay = behaviour.latency()
+        if delay > 0:
+            time.sleep(delay)
+        if behaviour.error_rate and random.random() < behaviour.error_rate:
+            behaviour.failed += 1
+            self.send_error(behaviour.error_status)
+            return
+
+        behaviour.served += 1
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=UTF-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        try:
+            if behaviour.drip_bytes:
+                for start in range(0, len(body), behaviour.drip_bytes):
+                    self.wfile.write(body[start:start + behaviour.drip_bytes])
+                    self.wfile.flush()
+                    time.sleep(behaviour.drip_interval)
+            else:
+                self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client hung up early (streaming extraction does that on purpose)
+            self.close_connection = True
+
+
+def load_pages(fixtures_dir=FIXTURES_DIR):
+    pages = {}
+    for filename in sorted(os.listdir(fixtures_dir)):
+        if filename.endswith('.html'):
+            with open(os.path.join(fixtures_dir, filename), 'rb') as f:
+                pages[filename[:-len('.html')]] = f.read()
+    return pages
+
+
+def start_standin(handler=StandinHandler, host='127.0.0.1', port=0, fixtures_dir=FIXTURES_DIR, behaviour=None):
+    handler.pages = load_pages(fixtures_dir)
+    if behaviour is not None:
+        handler.behaviour = behaviour
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://{host}:{server.server_address[1]}'
+
+
+def add_behaviour_arguments(parser):
+    parser.add_argument('--latency', default='none', help="upstream latency: none, fixed:S, uniform:LOW,HIGH, exp:MEAN or lognormal:MEDIAN,SIGMA")
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of profile requests answered with --error-status')
+    parser.add_argument('--error-status', type=int, default=503)
+    parser.add_argument('--drip-bytes', type=int, default=0, help='send bodies in chunks of this many bytes (0 = all at once)')
+    parser.add_argument('--drip-interval', type=float, default=0.0, help='seconds between drip chunks')
+
+
+def behaviour_from_args(args):
+    return Behaviour(args.latency, args.error_rate, args.error_status, args.drip_bytes, args.drip_interval)
+
+
+# Fake Skillrack for running the API (e.g. under gunicorn) against on one box
+#   python -m bench.standin --port 8081 --latency lognormal:0.3,0.6 --error-rate 0.02
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve Skillrack-like profile pages with simulated latency and failures')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--fixtures', default=FIXTURES_DIR)
+    add_behaviour_arguments(parser)
+    args = parser.parse_args()
+
+    server, url = start_standin(host=args.host, port=args.port, fixtures_dir=args.fixtures, behaviour=behaviour_from_args(args))
+    print(f'Serving profiles at {url}/profile/<id>/<key>', flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
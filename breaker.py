@@ -0,0 +1,249 @@
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
+# Circuit breaker settings, overridable from the environment. The circuit opens when, over the
+# last CIRCUIT_WINDOW seconds (and at least CIRCUIT_MIN_CALLS fetches), too many fetches failed
+# or took longer than CIRCUIT_SLOW_CALL_SECONDS
+CIRCUIT_WINDOW = float(os.environ.get('CIRCUIT_WINDOW', 30))
+CIRCUIT_MIN_CALLS = int(os.environ.get('CIRCUIT_MIN_CALLS', 10))
+CIRCUIT_ERROR_RATE = float(os.environ.get('CIRCUIT_ERROR_RATE', 0.5))
+CIRCUIT_SLOW_CALL_SECONDS = float(os.environ.get('CIRCUIT_SLOW_CALL_SECONDS', 5))
+CIRCUIT_SLOW_CALL_RATE = float(os.environ.get('CIRCUIT_SLOW_CALL_RATE', 0.8))
+# How long the circuit stays open before letting probe fetches through
+CIRCUIT_OPEN_SECONDS = float(os.environ.get('CIRCUIT_OPEN_SECONDS', 30))
+CIRCUIT_HALF_OPEN_PROBES = int(os.environ.get('CIRCUIT_HALF_OPEN_PROBES', 1))
+
+# Adaptive concurrency limit on upstream fetches per worker (AIMD on observed latency)
+LIMIT_INITIAL = int(os.environ.get('UPSTREAM_LIMIT_INITIAL', 8))
+LIMIT_MIN = int(os.environ.get('UPSTREAM_LIMIT_MIN', 1))
+LIMIT_MAX = int(os.environ.get('UPSTREAM_LIMIT_MAX', 32))
+LIMIT_LATENCY_TARGET = float(os.environ.get('UPSTREAM_LIMIT_LATENCY_TARGET', 2))
+LIMIT_BACKOFF = float(os.environ.get('UPSTREAM_LIMIT_BACKOFF', 0.7))
+# How long a fetch may wait for a slot before failing fast
+LIMIT_QUEUE_TIMEOUT = float(os.environ.get('UPSTREAM_LIMIT_QUEUE_TIMEOUT', 5))
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class UpstreamUnavailable(Exception):
+    # Skillrack is failing or we are deliberately not calling it; retry_after is a hint in seconds
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(UpstreamUnavailable):
+    pass
+
+
+class CircuitBreaker:
+
+    def __init__(self, window=CIRCUIT_WINDOW, min_calls=CIRCUIT_MIN_CALLS, error_rate=CIRCUIT_ERROR_RATE,
+                 slow_call_seconds=CIRCUIT_SLOW_CALL_SECONDS, slow_call_rate=CIRCUIT_SLOW_CALL_RATE,
+                 open_seconds=CIRCUIT_OPEN_SECONDS, half_open_probes=CIRCUIT_HALF_OPEN_PROBES):
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.trips = 0
+        self.rejected = 0
+        self._calls = deque()
+        self._probes = 0
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        # Raises CircuitOpenError instead of letting the fetch through; returns True for a probe
+        with self._lock:
+            now = time.monotonic()
+            if self.state == OPEN:
+                remaining = self.open_seconds - (now - self.opened_at)
+                if remaining > 0:
+                    self.rejected += 1
+                    raise CircuitOpenError('Skillrack is unavailable (circuit open)', retry_after=remaining)
+                self.state = HALF_OPEN
+                self._probes = 0
+            if self.state == HALF_OPEN:
+                if self._probes >= self.half_open_probes:
+                    self.rejected += 1
+                    raise CircuitOpenError('Skillrack is unavailable (circuit half-open)', retry_after=1)
+                self._probes += 1
+                return True
+            return False
+
+    def cancel_probe(self):
+        # A probe that never reached Skillrack frees its slot
+        with self._lock:
+            if self.state == HALF_OPEN and self._probes:
+                self._probes -= 1
+
+    def record(self, ok, latency):
+        slow = latency >= self.slow_call_seconds
+        with self._lock:
+            now = time.monotonic()
+            if self.state == HALF_OPEN:
+                if ok and not slow:
+                    self.state = CLOSED
+                    self._calls.clear()
+                else:
+                    self._open(now)
+                return
+            if self.state == OPEN:
+                return
+
+            self._calls.append((now, ok, slow))
+            while self._calls and now - self._calls[0][0] > self.window:
+                self._calls.popleft()
+            if len(self._calls) < self.min_calls:
+                return
+            failures = sum(1 for _, call_ok, _ in self._calls if not call_ok)
+            slow_calls = sum(1 for _, _, call_slow in self._calls if call_slow)
+            if failures / len(self._calls) >= self.error_rate or slow_calls / len(self._calls) >= self.slow_call_rate:
+                self._open(now)
+
+    def _open(self, now):
+        self.state = OPEN
+        self.opened_at = now
+        self.trips += 1
+        self._calls.clear()
+
+    def status(self):
+        with self._lock:
+            status = {
+                'state': self.state,
+                'trips': self.trips,
+                'rejected': self.rejected,
+                'recent_calls': len(self._calls),
+                'recent_failures': sum(1 for _, ok, _ in self._calls if not ok),
+            }
+            if self.state == OPEN:
+                status['retry_after'] = max(0.0, self.open_seconds - (time.monotonic() - self.opened_at))
+            return status
+
+
+class AdaptiveLimiter:
+    # Additive increase / multiplicative decrease: the limit grows by one per limit's worth of
+    # fast fetches while it is actually being used, and shrinks on an error or a slow fetch
+
+    def __init__(self, initial=LIMIT_INITIAL, minimum=LIMIT_MIN, maximum=LIMIT_MAX,
+                 latency_target=LIMIT_LATENCY_TARGET, backoff=LIMIT_BACKOFF):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.limit = float(min(max(initial, minimum), maximum))
+        self.in_flight = 0
+        self.rejected = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def try_acquire(self):
+        with self._cond:
+            if self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return True
+            return False
+
+    def acquire(self, timeout=LIMIT_QUEUE_TIMEOUT):
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.rejected += 1
+                    return False
+                self._cond.wait(remaining)
+            self.in_flight += 1
+            return True
+
+    async def aacquire(self, timeout=LIMIT_QUEUE_TIMEOUT):
+        # The limit is shared with threads, so the event loop polls instead of blocking on it
+        import asyncio
+
+        deadline = time.monotonic() + timeout
+        while not self.try_acquire():
+            if time.monotonic() >= deadline:
+                with self._cond:
+                    self.rejected += 1
+                return False
+            await asyncio.sleep(0.01)
+        return True
+
+    def release(self, ok=None, latency=0.0):
+        # ok=None releases the slot without counting the fetch either way
+        with self._cond:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if ok is None:
+                pass
+            elif not ok or latency > self.latency_target:
+                # Back off at most once per target latency, so a burst of slow fetches counts once
+                if now - self._last_decrease >= self.latency_target:
+                    self.limit = max(self.minimum, self.limit * self.backoff)
+                    self._last_decrease = now
+            elif self.in_flight + 1 >= self.limit / 2:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._cond.notify()
+
+    def status(self):
+        with self._cond:
+            return {'limit': int(self.limit), 'in_flight': self.in_flight, 'rejected': self.rejected}
+
+
+class UpstreamGuard:
+    # Every Skillrack fetch passes the circuit breaker, then waits for a concurrency slot
+
+    def __init__(self, breaker=None, limiter=None):
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        self.limiter = limiter if limiter is not None else AdaptiveLimiter()
+
+    def _overloaded(self, probe):
+        if probe:
+            self.breaker.cancel_probe()
+        return UpstreamUnavailable('Too many Skillrack fetches in progress', retry_after=1)
+
+    @contextmanager
+    def guard(self):
+        probe = self.breaker.before_call()
+        if not self.limiter.acquire():
+            raise self._overloaded(probe)
+        start = time.monotonic()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            self._finish(ok, time.monotonic() - start)
+
+    @asynccontextmanager
+    async def aguard(self):
+        probe = self.breaker.before_call()
+        if not await self.limiter.aacquire():
+            raise self._overloaded(probe)
+        start = time.monotonic()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            self._finish(ok, time.monotonic() - start)
+
+    def _finish(self, ok, latency):
+        self.breaker.record(ok, latency)
+        self.limiter.release(ok, latency)
+
+    def status(self):
+        return {'circuit': self.breaker.status(), 'limiter': self.limiter.status()}
+
+
+upstream_guard = UpstreamGuard()
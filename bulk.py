@@ -0,0 +1,326 @@
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import unquote
+
+from breaker import CircuitOpenError, UpstreamUnavailable
+from records import PROFILE_FIELDS, dumps
+from scrape import scrape_skillrack_profile
+
+# Offline bulk import/export: streams a CSV/JSONL (or plain list) of profile URLs through a
+# bounded pool of scrapes and appends each profile to a JSONL, CSV or Parquet output as it comes
+# in. Memory stays flat whatever the input size, and a checkpoint next to the output lets an
+# interrupted run resume without refetching anything that was already written.
+#   python bulk.py urls.csv profiles.jsonl
+#   python bulk.py urls.jsonl stats.csv --concurrency 16
+#   python bulk.py urls.csv stats.parquet          (needs pyarrow; writes a directory of parts)
+# URLs that fail go to <output>.errors.jsonl, which is a valid input for a retry run.
+BULK_CONCURRENCY = int(os.environ.get('BULK_CONCURRENCY', 8))
+# JSONL/CSV rows between checkpoints; each Parquet part is checkpointed once written
+BULK_CHECKPOINT_EVERY = int(os.environ.get('BULK_CHECKPOINT_EVERY', 100))
+BULK_PARQUET_ROWS = int(os.environ.get('BULK_PARQUET_ROWS', 5000))
+# How far input rows may be handed out past the oldest unfinished one; bounds the checkpoint
+# (and memory) when a few URLs are much slower than the rest
+BULK_REORDER_WINDOW = int(os.environ.get('BULK_REORDER_WINDOW', 1000))
+# Times a URL waits out an open circuit or a full upstream limit before it counts as failed, and
+# the most it waits in all (seconds). A circuit still open after that stops the run (checkpoint
+# saved, run it again to resume) rather than failing every remaining URL the same way
+BULK_UPSTREAM_RETRIES = 5
+BULK_UPSTREAM_MAX_WAIT = float(os.environ.get('BULK_UPSTREAM_MAX_WAIT', 60))
+
+FORMATS = ('jsonl', 'csv', 'parquet')
+EXPORT_FIELDS = tuple(name for name in PROFILE_FIELDS if name != 'stale')
+INTEGER_FIELDS = ('code_tutor', 'code_track', 'code_test', 'dt', 'dc', 'points', 'required_points', 'percentage')
+
+
+def read_urls(path, column='url'):
+    # Yields the URL of every input row in order, without loading the file
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        if path.endswith('.csv'):
+            reader = csv.reader(f)
+            header = next(reader, None) or []
+            index = header.index(column) if column in header else 0
+            if column not in header and header and header[0].strip().startswith('http'):
+                yield header[0].strip()  # No header row
+            for row in reader:
+                if row:
+                    yield row[index].strip() if index < len(row) else ''
+        elif path.endswith(('.jsonl', '.ndjson')):
+            for line in f:
+                if line.strip():
+                    item = json.loads(line)
+                    yield str(item.get(column, '')) if isinstance(item, dict) else str(item)
+        else:
+            for line in f:
+                if line.strip():
+                    yield line.strip()
+
+
+class JsonlWriter:
+    # Appends one JSON profile per line; state is the byte offset of the last checkpoint, and
+    # anything after it (written by an interrupted run) is truncated on resume
+    commit_every = BULK_CHECKPOINT_EVERY
+
+    def __init__(self, path, state=None):
+        offset = (state or {}).get('offset', 0)
+        self._file = open(path, 'r+b' if offset else 'wb')
+        self._file.truncate(offset)
+        self._file.seek(offset)
+        if not offset:
+            self.start()
+
+    def start(self):
+        pass
+
+    def write(self, record):
+        self._file.write(record.json_bytes() + b'\n')
+
+    def commit(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return {'offset': self._file.tell()}
+
+    def close(self):
+        self._file.close()
+
+
+class CsvWriter(JsonlWriter):
+
+    def __init__(self, path, state=None):
+        self._buffer = io.StringIO()
+        self._csv = csv.writer(self._buffer)
+        super().__init__(path, state)
+
+    def start(self):
+        self._write_row(EXPORT_FIELDS)
+
+    def write(self, record):
+        self._write_row([record.get(name) for name in EXPORT_FIELDS])
+
+    def _write_row(self, values):
+        self._csv.writerow(values)
+        self._file.write(self._buffer.getvalue().encode('utf-8'))
+        self._buffer.seek(0)
+        self._buffer.truncate()
+
+
+class ParquetWriter:
+    # A directory of part files, each written whole (temp file + rename) and checkpointed, so a
+    # crash never leaves a half-written part; state is the number of finished parts
+    commit_every = BULK_PARQUET_ROWS
+
+    def __init__(self, path, state=None):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise SystemExit('Parquet output needs pyarrow (pip install pyarrow)')
+        self._pa = pyarrow
+        self._pq = pyarrow.parquet
+        self._schema = pyarrow.schema([
+            (name, pyarrow.int64() if name in INTEGER_FIELDS else pyarrow.float64() if name == 'percentage_completed' else pyarrow.string())
+            for name in EXPORT_FIELDS
+        ])
+        self._path = path
+        self._parts = (state or {}).get('parts', 0)
+        self._rows = []
+        os.makedirs(path, exist_ok=True)
+        for filename in os.listdir(path):
+            # Parts past the checkpoint belong to an interrupted run
+            if filename.endswith('.tmp') or (filename.startswith('part-') and int(filename[5:10]) >= self._parts):
+                os.remove(os.path.join(path, filename))
+
+    def write(self, record):
+        row = {}
+        for name in EXPORT_FIELDS:
+            value = record.get(name)
+            if name in INTEGER_FIELDS and not isinstance(value, int):
+                value = None  # Counters the page showed as text
+            elif name not in INTEGER_FIELDS and name != 'percentage_completed' and value is not None:
+                value = str(value)
+            row[name] = value
+        self._rows.append(row)
+
+    def commit(self):
+        if self._rows:
+            part_path = os.path.join(self._path, f'part-{self._parts:05d}.parquet')
+            table = self._pa.Table.from_pylist(self._rows, schema=self._schema)
+            self._pq.write_table(table, part_path + '.tmp')
+            os.replace(part_path + '.tmp', part_path)
+            self._parts += 1
+            self._rows = []
+        return {'parts': self._parts}
+
+    def close(self):
+        pass
+
+
+WRITERS = {
+    'jsonl': JsonlWriter,
+    'csv': CsvWriter,
+    'parquet': ParquetWriter,
+}
+
+
+def scrape_url(url, stop=None):
+    # Waits out an open circuit or a full upstream limit instead of failing the URL right away,
+    # for at most BULK_UPSTREAM_MAX_WAIT in all; setting `stop` (on Ctrl-C) ends the wait at once
+    stop = stop or threading.Event()
+    deadline = time.monotonic() + BULK_UPSTREAM_MAX_WAIT
+    for attempt in range(BULK_UPSTREAM_RETRIES):
+        try:
+            return scrape_skillrack_profile(url)
+        except UpstreamUnavailable as e:
+            if e.retry_after is None or attempt == BULK_UPSTREAM_RETRIES - 1:
+                raise
+            if time.monotonic() + e.retry_after > deadline or stop.wait(e.retry_after):
+                raise
+
+
+def load_checkpoint(path, input_path, fmt):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        checkpoint = json.load(f)
+    if checkpoint['input'] != os.path.abspath(input_path) or checkpoint['format'] != fmt:
+        raise SystemExit(f'{path} belongs to a run of {checkpoint["input"]} ({checkpoint["format"]}); '
+                         'use the same input and format, or --restart')
+    return checkpoint
+
+
+def save_checkpoint(path, checkpoint):
+    with open(path + '.tmp', 'w') as f:
+        json.dump(checkpoint, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + '.tmp', path)
+
+
+def run(input_path, output_path, fmt, concurrency=BULK_CONCURRENCY, column='url', restart=False, progress=sys.stderr):
+    checkpoint_path = output_path + '.checkpoint'
+    errors_path = output_path + '.errors.jsonl'
+    checkpoint = None if restart else load_checkpoint(checkpoint_path, input_path, fmt)
+    if checkpoint is None and not restart and os.path.exists(output_path):
+        raise SystemExit(f'{output_path} already exists; pass --restart to overwrite it')
+    if checkpoint is None:
+        checkpoint = {'input': os.path.abspath(input_path), 'format': fmt, 'next': 0, 'done': [],
+                      'output': None, 'errors_offset': 0, 'written': 0, 'failed': 0}
+
+    # Saved before anything is written, so even a run killed right away can be resumed
+    save_checkpoint(checkpoint_path, checkpoint)
+    writer = WRITERS[fmt](output_path, checkpoint['output'])
+    errors = open(errors_path, 'r+b' if checkpoint['errors_offset'] else 'wb')
+    errors.truncate(checkpoint['errors_offset'])
+    errors.seek(checkpoint['errors_offset'])
+
+    # Rows before `watermark` are all finished; `finished` holds the finished rows past it
+    watermark = checkpoint['next']
+    finished = set(checkpoint['done'])
+    written, failed = checkpoint['written'], checkpoint['failed']
+    since_commit = 0
+    in_flight = {}
+    started = time.monotonic()
+    resumed_at = written + failed
+
+    def commit():
+        nonlocal since_commit
+        checkpoint['output'] = writer.commit()
+        errors.flush()
+        os.fsync(errors.fileno())
+        checkpoint.update(next=watermark, done=sorted(finished), errors_offset=errors.tell(), written=written, failed=failed)
+        save_checkpoint(checkpoint_path, checkpoint)
+        since_commit = 0
+
+    def finish(index, url, record, error):
+        nonlocal watermark, written, failed, since_commit
+        if error is None:
+            writer.write(record)
+            written += 1
+        else:
+            errors.write(dumps({'url': url, 'error': error}) + b'\n')
+            failed += 1
+        finished.add(index)
+        while watermark in finished:
+            finished.discard(watermark)
+            watermark += 1
+        since_commit += 1
+        if since_commit >= writer.commit_every:
+            commit()
+            done = written + failed
+            rate = (done - resumed_at) / (time.monotonic() - started)
+            print(f'{done} rows ({written} written, {failed} failed), {rate:.1f}/s', file=progress)
+
+    def collect(block):
+        done, _ = wait(in_flight, return_when=FIRST_COMPLETED, timeout=None if block else 0)
+        for future in done:
+            index, url = in_flight.pop(future)
+            try:
+                finish(index, url, future.result(), None)
+            except CircuitOpenError:
+                raise
+            except Exception as e:
+                finish(index, url, None, str(e) or e.__class__.__name__)
+
+    stop = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='bulk')
+    try:
+        for index, raw_url in enumerate(read_urls(input_path, column)):
+            if index < checkpoint['next'] or index in finished:
+                continue
+            url = unquote(raw_url)
+            if not url.startswith('http'):
+                finish(index, raw_url, None, 'Invalid URL provided')
+                continue
+            while in_flight and (len(in_flight) >= concurrency or index - watermark >= BULK_REORDER_WINDOW):
+                collect(block=True)
+            in_flight[executor.submit(scrape_url, url, stop)] = (index, url)
+            collect(block=False)
+        while in_flight:
+            collect(block=True)
+    except (KeyboardInterrupt, CircuitOpenError) as e:
+        # Keep what finished; rows still in flight are fetched again on resume. Workers waiting
+        # out the circuit stop waiting, so the process can exit once the checkpoint is saved
+        stop.set()
+        for future in in_flight:
+            future.cancel()
+        if isinstance(e, KeyboardInterrupt):
+            print('interrupted, saving checkpoint', file=progress)
+            raise
+        print('Skillrack is still unavailable, saving checkpoint', file=progress)
+        raise SystemExit(f'{e}; run the same command again later to resume') from e
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        commit()
+        writer.close()
+        errors.close()
+
+    os.remove(checkpoint_path)
+    if not failed:
+        os.remove(errors_path)
+    return written, failed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Scrape a file of profile URLs into a JSONL, CSV or Parquet dataset')
+    parser.add_argument('input', help='.csv (url column), .jsonl (url field) or one URL per line')
+    parser.add_argument('output', help='.jsonl, .csv or .parquet (a directory of part files)')
+    parser.add_argument('--format', choices=FORMATS, help='output format (default: from the output extension)')
+    parser.add_argument('--column', default='url', help='CSV column / JSONL field holding the URL')
+    parser.add_argument('--concurrency', type=int, default=BULK_CONCURRENCY, help='profiles scraped at once')
+    parser.add_argument('--restart', action='store_true', help='ignore any checkpoint and overwrite the output')
+    args = parser.parse_args()
+
+    fmt = args.format or os.path.splitext(args.output)[1].lstrip('.')
+    if fmt not in FORMATS:
+        parser.error('cannot tell the output format from the extension; pass --format')
+    try:
+        written, failed = run(args.input, args.output, fmt, args.concurrency, args.column, args.restart)
+    except KeyboardInterrupt:
+        sys.exit(130)
+    print(f'wrote {written} profiles to {args.output}' + (f', {failed} failed (see {args.output}.errors.jsonl)' if failed else ''))
@@ -0,0 +1,442 @@
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from urllib.parse import urlparse, parse_qs
+
+from records import ProfileRecord, decode_value, encode_value
+
+logger = logging.getLogger(__name__)
+
+# Cache settings (seconds / entries / bytes), overridable from the environment
+CACHE_TTL = float(os.environ.get('PROFILE_CACHE_TTL', 300))
+CACHE_STALE_TTL = float(os.environ.get('PROFILE_CACHE_STALE_TTL', 3600))
+CACHE_MAX_ENTRIES = int(os.environ.get('PROFILE_CACHE_MAX_ENTRIES', 5000))
+CACHE_MAX_BYTES = int(os.environ.get('PROFILE_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+# Where cached profiles live: 'memory' (per process), 'shm' / 'shm:<path>' (shared by the workers
+# on one machine) or a redis://, rediss:// or unix:// URL (shared by every instance; needs the
+# optional redis package, pip install redis)
+CACHE_BACKEND = os.environ.get('PROFILE_CACHE_BACKEND', 'memory')
+# Stale entries refreshed in the background at once; past that, stale copies are served without
+# starting a refresh until a slot frees up
+CACHE_REFRESH_WORKERS = int(os.environ.get('PROFILE_CACHE_REFRESH_WORKERS', 4))
+# Shared-memory backend ('shm' or 'shm:<path>'): slot count and the largest encoded entry it holds
+SHM_SLOTS = int(os.environ.get('PROFILE_CACHE_SHM_SLOTS', 8192))
+SHM_SLOT_BYTES = int(os.environ.get('PROFILE_CACHE_SHM_SLOT_BYTES', 2048))
+SHM_WAYS = 4
+
+_SHM_MAGIC = b'SRPCACHE'
+_SHM_FILE_HEADER = struct.Struct('<8sIII')  # magic, sets, ways, slot bytes
+_SHM_DATA_OFFSET = 64
+_SHM_SLOT_HEADER = struct.Struct('<16sdIc')  # key digest, fetched_at, payload length, payload kind
+_SHM_EMPTY_SLOT = _SHM_SLOT_HEADER.pack(bytes(16), 0.0, 0, b'\0')
+
+
+def normalize_profile_key(url):
+    # Skillrack links come as .../resume.xhtml?id=<id>&key=<key> or .../profile/<id>/<key>
+    parsed = urlparse(url.strip())
+    query = parse_qs(parsed.query)
+    profile_id = query.get('id', [None])[0]
+    key = query.get('key', [''])[0]
+    if not profile_id:
+        parts = [part for part in parsed.path.split('/') if part]
+        if len(parts) >= 2 and parts[0].lower() == 'profile':
+            profile_id = parts[1]
+            key = parts[2] if len(parts) > 2 else ''
+    if profile_id:
+        return f'skillrack:{profile_id}:{key}'
+    return 'url:' + parsed.netloc.lower() + parsed.path.rstrip('/') + ('?' + parsed.query if parsed.query else '')
+
+
+def _copy(value):
+    # Profile records are never mutated once built, so only plain dicts need a defensive copy
+    return dict(value) if isinstance(value, dict) else value
+
+
+def _entry_size(value):
+    # Approximate memory held by a cached value, without encoding it
+    if isinstance(value, ProfileRecord):
+        return value.footprint()
+    return len(json.dumps(value, default=str))
+
+
+class MemoryBackend:
+    # In-process LRU bounded both by entry count and by (approximate) memory size
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            value, fetched_at, _ = entry
+            return _copy(value), fetched_at
+
+    def set(self, key, value, fetched_at):
+        nbytes = _entry_size(value)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= old[2]
+            self._entries[key] = (_copy(value), fetched_at, nbytes)
+            self.size += nbytes
+            while self._entries and (len(self._entries) > self.max_entries or self.size > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= evicted[2]
+
+    def delete(self, key):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= old[2]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisBackend:
+    # Shared between gunicorn workers; works with Redis or any protocol-compatible server
+
+    def __init__(self, url, prefix='profile:', expire=None):
+        try:
+            import redis
+        except ImportError as e:
+            raise ImportError(f'PROFILE_CACHE_BACKEND={url} needs the redis package (pip install redis)') from e
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.expire = expire
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        if raw is None:
+            return None
+        entry = json.loads(raw)
+        return decode_value(entry['value']), entry['fetched_at']
+
+    def set(self, key, value, fetched_at):
+        raw = json.dumps({'value': encode_value(value), 'fetched_at': fetched_at}, default=str)
+        if self.expire:
+            self.client.set(self.prefix + key, raw, ex=int(self.expire) + 1)
+        else:
+            self.client.set(self.prefix + key, raw)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + '*'):
+            self.client.delete(key)
+
+
+def default_shm_path():
+    import tempfile
+    directory = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(directory, f'skillrack-profile-cache-{os.getuid()}')
+
+
+class SharedMemoryBackend:
+    # Set-associative hash table in a memory-mapped file (tmpfs by default) that every gunicorn
+    # worker maps, so the cache is held once per machine instead of once per worker. A full set
+    # evicts its oldest entry. Each set is guarded by an fcntl byte-range lock between processes
+    # and a thread lock within one (fcntl locks are per process).
+
+    def __init__(self, path=None, slots=SHM_SLOTS, slot_bytes=SHM_SLOT_BYTES, ways=SHM_WAYS):
+        import fcntl
+        self._fcntl = fcntl
+        self.path = path or default_shm_path()
+        self.ways = ways
+        self.sets = max(1, slots // ways)
+        self.slot_bytes = slot_bytes
+        self.set_bytes = ways * slot_bytes
+        size = _SHM_DATA_OFFSET + self.sets * self.set_bytes
+        header = _SHM_FILE_HEADER.pack(_SHM_MAGIC, self.sets, ways, slot_bytes)
+
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.lockf(self._fd, fcntl.LOCK_EX, _SHM_DATA_OFFSET, 0)
+        try:
+            # Reuse a segment left by earlier workers (warm cache across restarts) if the layout matches
+            if os.fstat(self._fd).st_size != size or os.pread(self._fd, len(header), 0) != header:
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, size)
+                os.pwrite(self._fd, header, 0)
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, _SHM_DATA_OFFSET, 0)
+        self._map = mmap.mmap(self._fd, size)
+        self._thread_locks = [threading.Lock() for _ in range(64)]
+
+    def _locate(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        return digest, int.from_bytes(digest[:8], 'little') % self.sets
+
+    @contextmanager
+    def _locked(self, set_index, exclusive):
+        start = _SHM_DATA_OFFSET + set_index * self.set_bytes
+        with self._thread_locks[set_index % len(self._thread_locks)]:
+            self._fcntl.lockf(self._fd, self._fcntl.LOCK_EX if exclusive else self._fcntl.LOCK_SH, self.set_bytes, start)
+            try:
+                yield start
+            finally:
+                self._fcntl.lockf(self._fd, self._fcntl.LOCK_UN, self.set_bytes, start)
+
+    def _slots(self, start):
+        for way in range(self.ways):
+            offset = start + way * self.slot_bytes
+            yield (offset, *_SHM_SLOT_HEADER.unpack_from(self._map, offset))
+
+    def get(self, key):
+        digest, set_index = self._locate(key)
+        with self._locked(set_index, False) as start:
+            for offset, slot_digest, fetched_at, length, kind in self._slots(start):
+                if length and slot_digest == digest:
+                    payload_offset = offset + _SHM_SLOT_HEADER.size
+                    payload = self._map[payload_offset:payload_offset + length]
+                    break
+            else:
+                return None
+        # Records are stored as their own JSON encoding, which the decoded record keeps reusing
+        if kind == b'R':
+            return ProfileRecord.from_json(payload), fetched_at
+        return decode_value(json.loads(payload)), fetched_at
+
+    def set(self, key, value, fetched_at):
+        if isinstance(value, ProfileRecord):
+            kind, payload = b'R', value.json_bytes()
+        else:
+            kind, payload = b'J', json.dumps(encode_value(value), default=str).encode('utf-8')
+        if len(payload) > self.slot_bytes - _SHM_SLOT_HEADER.size:
+            # Too big for a slot: don't leave an older copy behind either
+            logger.warning('Profile cache entry for %s is too large for the shared cache (%d bytes)', key, len(payload))
+            self.delete(key)
+            return
+
+        digest, set_index = self._locate(key)
+        with self._locked(set_index, True) as start:
+            # Overwrite the key's own slot, else an empty one, else the oldest entry in the set
+            match = empty = oldest = None
+            for offset, slot_digest, slot_fetched_at, length, _ in self._slots(start):
+                if not length:
+                    if empty is None:
+                        empty = offset
+                elif slot_digest == digest:
+                    match = offset
+                    break
+                elif oldest is None or slot_fetched_at < oldest[1]:
+                    oldest = (offset, slot_fetched_at)
+            target = match if match is not None else empty if empty is not None else oldest[0]
+            payload_offset = target + _SHM_SLOT_HEADER.size
+            self._map[payload_offset:payload_offset + len(payload)] = payload
+            _SHM_SLOT_HEADER.pack_into(self._map, target, digest, fetched_at, len(payload), kind)
+
+    def delete(self, key):
+        digest, set_index = self._locate(key)
+        with self._locked(set_index, True) as start:
+            for offset, slot_digest, _, length, _ in self._slots(start):
+                if length and slot_digest == digest:
+                    self._map[offset:offset + _SHM_SLOT_HEADER.size] = _SHM_EMPTY_SLOT
+
+    def clear(self):
+        for set_index in range(self.sets):
+            with self._locked(set_index, True) as start:
+                for way in range(self.ways):
+                    offset = start + way * self.slot_bytes
+                    self._map[offset:offset + _SHM_SLOT_HEADER.size] = _SHM_EMPTY_SLOT
+
+    def __len__(self):
+        # Unlocked count, good enough for stats
+        return sum(1 for set_index in range(self.sets)
+                   for _, _, _, length, _ in self._slots(_SHM_DATA_OFFSET + set_index * self.set_bytes) if length)
+
+
+class ProfileCache:
+    # TTL cache with stale-while-revalidate: an expired entry is still served while
+    # one background refresh per key runs, until it is older than ttl + stale_ttl.
+    # At most max_refreshes background refreshes run at a time, on a small thread pool.
+
+    def __init__(self, backend=None, ttl=CACHE_TTL, stale_ttl=CACHE_STALE_TTL, max_refreshes=CACHE_REFRESH_WORKERS):
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_refreshes = max(1, max_refreshes)
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self._refreshing = set()
+        self._tasks = set()
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+
+    def get_or_fetch(self, key, fetch):
+        if self.ttl <= 0:
+            return fetch()
+
+        value, stale = self._lookup(key)
+        if value is not None:
+            if stale and self._claim_refresh(key):
+                self._refresh_executor().submit(self._refresh, key, fetch)
+            return value
+
+        self._count_miss()
+        value = fetch()
+        self.backend.set(key, value, time.time())
+        return _copy(value)
+
+    async def aget_or_fetch(self, key, fetch):
+        # Same as get_or_fetch, for coroutine fetchers running on an event loop
+        import asyncio
+
+        if self.ttl <= 0:
+            return await fetch()
+
+        value, stale = self._lookup(key)
+        if value is not None:
+            if stale and self._claim_refresh(key):
+                task = asyncio.ensure_future(self._arefresh(key, fetch))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+            return value
+
+        self._count_miss()
+        value = await fetch()
+        self.backend.set(key, value, time.time())
+        return _copy(value)
+
+    def last_known(self, key):
+        # Whatever is cached for the key, however old (the backend may still have evicted it)
+        entry = self.backend.get(key)
+        return entry[0] if entry is not None else None
+
+    def peek(self, key):
+        # (value, stale) without fetching, refreshing or counting; value is None when nothing is cached
+        entry = self.backend.get(key)
+        if entry is None:
+            return None, False
+        value, fetched_at = entry
+        return value, time.time() - fetched_at >= self.ttl
+
+    def age(self, key):
+        # Seconds since the cached copy was fetched (by any worker sharing the backend), or None
+        entry = self.backend.get(key)
+        return time.time() - entry[1] if entry is not None else None
+
+    def put(self, key, value):
+        if self.ttl > 0:
+            self.backend.set(key, value, time.time())
+
+    def save_snapshot(self, path, keys):
+        # Writes the cached entries for `keys` as JSON lines that restore_snapshot can load at boot
+        written = 0
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for key in keys:
+                entry = self.backend.get(key)
+                if entry is None:
+                    continue
+                value, fetched_at = entry
+                f.write(json.dumps({'key': key, 'fetched_at': fetched_at, 'value': encode_value(value)}, default=str) + '\n')
+                written += 1
+        os.replace(tmp_path, path)
+        return written
+
+    def restore_snapshot(self, path):
+        # Entries keep their original fetch time, so old ones are served stale (or only as a fallback)
+        restored = 0
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self.backend.set(entry['key'], decode_value(entry['value']), entry['fetched_at'])
+                    restored += 1
+        return restored
+
+    def invalidate(self, key):
+        self.backend.delete(key)
+
+    def clear(self):
+        self.backend.clear()
+
+    def _lookup(self, key):
+        # Returns (value, stale); value is None on a miss or once even stale data is too old
+        entry = self.backend.get(key)
+        if entry is None:
+            return None, False
+        value, fetched_at = entry
+        age = time.time() - fetched_at
+        if age < self.ttl:
+            with self._lock:
+                self.hits += 1
+            return value, False
+        if age < self.ttl + self.stale_ttl:
+            with self._lock:
+                self.stale_hits += 1
+            return value, True
+        return None, False
+
+    def _count_miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def _claim_refresh(self, key):
+        # Only one background refresh per key at a time, and at most max_refreshes in all
+        with self._lock:
+            if key in self._refreshing or len(self._refreshing) >= self.max_refreshes:
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def _refresh_executor(self):
+        # Created on first use in each process, since pool threads don't survive a fork
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                from concurrent.futures import ThreadPoolExecutor
+                self._executor = ThreadPoolExecutor(max_workers=self.max_refreshes, thread_name_prefix='cache-refresh')
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def _refresh(self, key, fetch):
+        try:
+            self.backend.set(key, fetch(), time.time())
+        except Exception:
+            # Keep serving the stale copy; the next request will try again
+            logger.exception('Background refresh failed for %s', key)
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    async def _arefresh(self, key, fetch):
+        try:
+            self.backend.set(key, await fetch(), time.time())
+        except Exception:
+            logger.exception('Background refresh failed for %s', key)
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+
+def create_backend(spec=CACHE_BACKEND):
+    if spec.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisBackend(spec, expire=CACHE_TTL + CACHE_STALE_TTL)
+    if spec == 'shm' or spec.startswith('shm:'):
+        return SharedMemoryBackend(spec[len('shm:'):] or None)
+    return MemoryBackend()
+
+
+profile_cache = ProfileCache(create_backend())
@@ -0,0 +1,68 @@
+import os
+from datetime import datetime
+
+COHORT_MAX_PROFILES = int(os.environ.get('COHORT_MAX_PROFILES', 5000))
+# Same assumption as /api/trackwithbuddy: one code_track (2 points) and one DC (2 points) a day
+DEFAULT_POINTS_PER_DAY = 2 + 2
+
+SUMMARY_FIELDS = ('id', 'name', 'dept', 'year', 'college', 'url', 'last_fetched')
+
+
+def is_on_track(days_left, points, required_points, points_per_day=DEFAULT_POINTS_PER_DAY):
+    # The rule behind both /api/trackwithbuddy and the cohort; takes numbers or NumPy columns.
+    # The gap is not clipped, so a profile already past its required points stays on track
+    # even once the lastdate has passed
+    return days_left * points_per_day >= required_points - points
+
+
+def compute_cohort(profiles, lastdate, points_per_day=DEFAULT_POINTS_PER_DAY, today=None):
+    # One vectorized pass over the whole group: every profile becomes a row of a few columns
+    import numpy as np
+
+    today = today or datetime.now()
+    days_left = (datetime.strptime(lastdate, '%d-%m-%Y') - today).days
+
+    points = np.fromiter((_number(p.get('points')) for p in profiles), dtype=np.float64, count=len(profiles))
+    required = np.fromiter((_number(p.get('required_points')) for p in profiles), dtype=np.float64, count=len(profiles))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        percentage_completed = np.where(required > 0, points / required * 100, 100.0)
+    points_to_complete = np.maximum(required - points, 0)
+    required_daily_rate = points_to_complete / max(days_left, 1)
+    on_track = is_on_track(days_left, points, required, points_per_day)
+
+    # Competition ranking by points: equal points share a rank, the next rank skips ahead
+    ascending = np.sort(points)
+    rank = len(points) - np.searchsorted(ascending, points, side='right') + 1
+    order = np.lexsort((np.arange(len(points)), -points))
+
+    leaderboard = []
+    for i in order.tolist():
+        row = {field: profiles[i].get(field) for field in SUMMARY_FIELDS}
+        row.update({
+            'points': profiles[i].get('points'),
+            'required_points': profiles[i].get('required_points'),
+            'percentage_completed': float(percentage_completed[i]),
+            'points_to_complete': float(points_to_complete[i]),
+            'required_daily_rate': float(required_daily_rate[i]),
+            'rank': int(rank[i]),
+            'status': 'On Track to Complete' if on_track[i] else 'Not on Track',
+        })
+        leaderboard.append(row)
+
+    return {
+        'lastdate': lastdate,
+        'days_left': days_left,
+        'points_per_day': points_per_day,
+        'count': len(profiles),
+        'on_track_count': int(on_track.sum()),
+        'average_points': float(points.mean()) if len(points) else 0.0,
+        'leaderboard': leaderboard,
+        'on_track': [row['url'] for row in leaderboard if row['status'] == 'On Track to Complete'],
+        'not_on_track': [row['url'] for row in leaderboard if row['status'] == 'Not on Track'],
+    }
+
+
+def _number(value):
+    # Counters that upstream rendered as text (e.g. '-') count as zero
+    return value if isinstance(value, (int, float)) else 0
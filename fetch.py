@@ -0,0 +1,431 @@
+import codecs
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+
+from breaker import UpstreamUnavailable, upstream_guard
+from parsers import DEFAULT_ENGINE, ProfileStreamParser
+from metrics import UPSTREAM_BYTES, UPSTREAM_ERRORS, UPSTREAM_IN_FLIGHT, UPSTREAM_RESPONSES, UPSTREAM_RETRIES, stage
+
+# Upstream fetch settings, overridable from the environment
+CONNECT_TIMEOUT = float(os.environ.get('UPSTREAM_CONNECT_TIMEOUT', 3.05))
+READ_TIMEOUT = float(os.environ.get('UPSTREAM_READ_TIMEOUT', 10))
+POOL_SIZE = int(os.environ.get('UPSTREAM_POOL_SIZE', 32))
+MAX_RETRIES = int(os.environ.get('UPSTREAM_MAX_RETRIES', 2))
+BACKOFF_BASE = float(os.environ.get('UPSTREAM_BACKOFF_BASE', 0.25))
+BACKOFF_MAX = float(os.environ.get('UPSTREAM_BACKOFF_MAX', 2))
+# Retry-After hint (seconds) when Skillrack can't be reached at all
+TRANSPORT_RETRY_AFTER = float(os.environ.get('UPSTREAM_TRANSPORT_RETRY_AFTER', 5))
+# Retries may add at most this fraction of extra load on top of first attempts
+RETRY_BUDGET_RATIO = float(os.environ.get('UPSTREAM_RETRY_BUDGET_RATIO', 0.1))
+RETRY_BUDGET_MIN = float(os.environ.get('UPSTREAM_RETRY_BUDGET_MIN', 10))
+VALIDATOR_CACHE_SIZE = int(os.environ.get('UPSTREAM_VALIDATOR_CACHE_SIZE', 1024))
+# Bodies larger than this (after content decoding) are abandoned
+MAX_BODY_BYTES = int(os.environ.get('UPSTREAM_MAX_BODY_BYTES', 2 * 1024 * 1024))
+CHUNK_SIZE = int(os.environ.get('UPSTREAM_CHUNK_SIZE', 16 * 1024))
+# After an early stop, a remainder this small is still read so the keep-alive connection survives
+DRAIN_MAX_BYTES = int(os.environ.get('UPSTREAM_DRAIN_MAX_BYTES', 8 * 1024))
+# Fetch-and-extract in one pass, hanging up once the profile fields are parsed (stream engine only)
+STREAM_EXTRACT = os.environ.get('UPSTREAM_STREAM_EXTRACT', '1') not in ('0', 'false', 'no', '') and DEFAULT_ENGINE == 'stream'
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+USER_AGENT = 'skillrack-tracker/1.0 (+https://github.com/MuthuKumaran-Dev-10000/Skillrack)'
+
+
+class RetryBudget:
+    # Token bucket shared by all requests in the worker: each first attempt deposits
+    # RETRY_BUDGET_RATIO tokens, each retry withdraws one
+
+    def __init__(self, ratio=RETRY_BUDGET_RATIO, minimum=RETRY_BUDGET_MIN):
+        self.ratio = ratio
+        self.maximum = max(minimum, 1)
+        self.tokens = self.maximum
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self.tokens = min(self.maximum, self.tokens + self.ratio)
+
+    def withdraw(self):
+        with self._lock:
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+
+class ValidatorCache:
+    # Remembers ETag / Last-Modified and the body they belong to, so unchanged
+    # pages can be revalidated with a conditional request
+
+    def __init__(self, max_entries=VALIDATOR_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def headers_for(self, url):
+        with self._lock:
+            entry = self._entries.get(url)
+        if entry is None:
+            return {}
+        etag, last_modified, _ = entry
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        return headers
+
+    def body_for(self, url):
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is None:
+                return None
+            self._entries.move_to_end(url)
+            return entry[2]
+
+    def store(self, url, response, body):
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        with self._lock:
+            if not etag and not last_modified:
+                self._entries.pop(url, None)
+                return
+            self._entries[url] = (etag, last_modified, body)
+            self._entries.move_to_end(url)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class BodyTooLarge(UpstreamUnavailable):
+    pass
+
+
+retry_budget = RetryBudget()
+validators = ValidatorCache()
+# Revalidated streaming fetches reuse the fields extracted last time, not a body
+extract_validators = ValidatorCache()
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+_async_client = None
+
+
+def get_session():
+    # One pooled keep-alive session per worker process (re-created after fork)
+    global _session, _session_pid
+    if _session is None or _session_pid != os.getpid():
+        with _session_lock:
+            if _session is None or _session_pid != os.getpid():
+                # requests is imported on the first fetch, not at startup (see serverless.py)
+                import requests
+                from requests.adapters import HTTPAdapter
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                session.headers['User-Agent'] = USER_AGENT
+                _session, _session_pid = session, os.getpid()
+    return _session
+
+
+def backoff_delay(attempt):
+    # Exponential backoff with full jitter
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+
+def _too_large():
+    return BodyTooLarge(f'Skillrack response is larger than {MAX_BODY_BYTES} bytes')
+
+
+def _incremental_decoder(encoding):
+    try:
+        return codecs.getincrementaldecoder(encoding or 'utf-8')(errors='replace')
+    except LookupError:
+        return codecs.getincrementaldecoder('utf-8')(errors='replace')
+
+
+def _worth_draining(response, received):
+    length = response.headers.get('Content-Length', '')
+    return length.isdigit() and int(length) - received <= DRAIN_MAX_BYTES
+
+
+def _read_capped(response):
+    # response.content, but giving up once the body passes MAX_BODY_BYTES
+    chunks = []
+    received = 0
+    for chunk in response.iter_content(CHUNK_SIZE):
+        received += len(chunk)
+        if received > MAX_BODY_BYTES:
+            raise _too_large()
+        chunks.append(chunk)
+    # Hand the body back to requests so .text / .content work as usual
+    response._content = b''.join(chunks)
+    return received
+
+
+def _read_text(response):
+    with stage('decode'):
+        return response.text
+
+
+def _stream_extract(response, labels=()):
+    # Decodes and parses the body chunk by chunk and stops reading as soon as the parser has
+    # every field; unless the rest is short, closing the response then drops it with the connection
+    parser = ProfileStreamParser(labels)
+    decoder = _incremental_decoder(response.encoding)
+    received = 0
+    chunks = response.iter_content(CHUNK_SIZE)
+    with stage('stream_extract'):
+        for chunk in chunks:
+            received += len(chunk)
+            if received > MAX_BODY_BYTES:
+                raise _too_large()
+            parser.feed(decoder.decode(chunk))
+            if parser.done:
+                if _worth_draining(response, received):
+                    received += sum(len(chunk) for chunk in chunks)
+                break
+        else:
+            parser.feed(decoder.decode(b'', final=True))
+            parser.close()
+    UPSTREAM_BYTES.observe(received)
+    return parser.result()
+
+
+def _transport_errors():
+    # Failures to get a page (or the rest of its body) out of Skillrack, worth another attempt
+    import requests
+    return (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError,
+            requests.exceptions.ContentDecodingError)
+
+
+def _unreachable(e):
+    # What a transport error turns into once the retries are used up, so callers fall back to the
+    # last known profile (or answer 503) like for any other upstream failure
+    return UpstreamUnavailable(f'Skillrack could not be reached ({e.__class__.__name__})', retry_after=TRANSPORT_RETRY_AFTER)
+
+
+def _get(session, url, headers=None, read_body=True):
+    # Times connect + time to first byte separately from the body download
+    response = None
+    try:
+        with stage('upstream_wait'):
+            response = session.get(url, headers=headers, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), stream=True)
+        if read_body:
+            with stage('upstream_body'):
+                received = _read_capped(response)
+    except (BodyTooLarge,) + _transport_errors():
+        if response is not None:
+            response.close()
+        raise
+    UPSTREAM_RESPONSES.inc(status=response.status_code)
+    if read_body:
+        UPSTREAM_BYTES.observe(received)
+    return response
+
+
+def require_profile(extracted):
+    # Skillrack answers some failures with a 200 page that has no profile on it. Parsed, it would
+    # be an all-zero profile that gets cached, pushed and recorded as a dip in the history, so it
+    # fails the fetch (inside the guard, where the breaker counts it) instead
+    if extracted['name'] is None and not extracted['stats']:
+        raise UpstreamUnavailable('Skillrack returned a page without profile data')
+    return extracted
+
+
+def fetch_page(url, extract=None):
+    # With extract, returns extract(html), checked for a profile before the fetch counts as done
+    with upstream_guard.guard(), UPSTREAM_IN_FLIGHT.track_inprogress():
+        html = _fetch(url, validators, _read_text, read_body=True)
+        if extract is None:
+            return html
+        with stage('parse'):
+            return require_profile(extract(html))
+
+
+def fetch_extracted(url, labels=()):
+    # Streaming twin of fetch_page(url, extract_profile): returns the extracted fields. Reading
+    # stops once the statistics for `labels` are in (the whole page is read without them)
+    read = lambda response: _stream_extract(response, labels)
+    with upstream_guard.guard(), UPSTREAM_IN_FLIGHT.track_inprogress():
+        return require_profile(_fetch(url, extract_validators, read, read_body=False))
+
+
+def _raise_for_upstream_status(status):
+    # An error page from an overloaded Skillrack must not be parsed (and cached) as a zeroed profile
+    if status in RETRY_STATUSES:
+        raise UpstreamUnavailable(f'Skillrack returned HTTP {status}', retry_after=1)
+
+
+def _fetch(url, cache, read, read_body):
+    # Retry loop shared by both fetch modes; read(response) turns the final response into the result
+    transport_errors = _transport_errors()
+    session = get_session()
+    retry_budget.deposit()
+    attempt = 0
+    while True:
+        try:
+            response = _get(session, url, cache.headers_for(url), read_body)
+            if response.status_code == 304:
+                response.close()
+                body = cache.body_for(url)
+                if body is not None:
+                    return body
+                # We lost the body we were revalidating; fetch it unconditionally
+                response = _get(session, url, read_body=read_body)
+            if response.status_code not in RETRY_STATUSES or attempt >= MAX_RETRIES or not retry_budget.withdraw():
+                try:
+                    _raise_for_upstream_status(response.status_code)
+                    body = read(response)
+                finally:
+                    response.close()
+                if response.ok:
+                    cache.store(url, response, body)
+                return body
+            response.close()
+        except transport_errors as e:
+            UPSTREAM_ERRORS.inc(kind=e.__class__.__name__)
+            if attempt >= MAX_RETRIES or not retry_budget.withdraw():
+                raise _unreachable(e) from e
+        UPSTREAM_RETRIES.inc()
+        time.sleep(backoff_delay(attempt))
+        attempt += 1
+
+
+def get_async_client():
+    # One pooled httpx client per event loop process, used by the ASGI app
+    global _async_client
+    if _async_client is None or _async_client.is_closed:
+        import httpx
+        _async_client = httpx.AsyncClient(
+            headers={'User-Agent': USER_AGENT},
+            timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=POOL_SIZE * 4, max_keepalive_connections=POOL_SIZE),
+            follow_redirects=True,
+        )
+    return _async_client
+
+
+async def close_async_client():
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+
+
+async def fetch_page_async(url, extract=None):
+    # Non-blocking twin of fetch_page with the same retry budget and validators; extract returns
+    # an awaitable here
+    async with upstream_guard.aguard():
+        with UPSTREAM_IN_FLIGHT.track_inprogress():
+            html = await _fetch_async(url, validators, _aread_text, read_body=True)
+            if extract is None:
+                return html
+            return require_profile(await extract(html))
+
+
+async def fetch_extracted_async(url, labels=()):
+    read = lambda response: _astream_extract(response, labels)
+    async with upstream_guard.aguard():
+        with UPSTREAM_IN_FLIGHT.track_inprogress():
+            return require_profile(await _fetch_async(url, extract_validators, read, read_body=False))
+
+
+async def _aread_capped(response):
+    chunks = []
+    received = 0
+    async for chunk in response.aiter_bytes(CHUNK_SIZE):
+        received += len(chunk)
+        if received > MAX_BODY_BYTES:
+            raise _too_large()
+        chunks.append(chunk)
+    # Same as response.aread(), which would not stop at the cap
+    response._content = b''.join(chunks)
+    return received
+
+
+async def _aread_text(response):
+    return response.text
+
+
+async def _astream_extract(response, labels=()):
+    parser = ProfileStreamParser(labels)
+    decoder = _incremental_decoder(response.charset_encoding)
+    received = 0
+    chunks = response.aiter_bytes(CHUNK_SIZE)
+    with stage('stream_extract'):
+        async for chunk in chunks:
+            received += len(chunk)
+            if received > MAX_BODY_BYTES:
+                raise _too_large()
+            parser.feed(decoder.decode(chunk))
+            if parser.done:
+                if _worth_draining(response, received):
+                    async for chunk in chunks:
+                        received += len(chunk)
+                break
+        else:
+            parser.feed(decoder.decode(b'', final=True))
+            parser.close()
+    UPSTREAM_BYTES.observe(received)
+    return parser.result()
+
+
+def _atransport_errors():
+    import httpx
+    return (httpx.TransportError, httpx.DecodingError)
+
+
+async def _aget(client, url, headers=None, read_body=True):
+    response = None
+    try:
+        with stage('upstream_fetch'):
+            response = await client.send(client.build_request('GET', url, headers=headers), stream=True)
+            if read_body:
+                received = await _aread_capped(response)
+    except (BodyTooLarge,) + _atransport_errors():
+        if response is not None:
+            await response.aclose()
+        raise
+    UPSTREAM_RESPONSES.inc(status=response.status_code)
+    if read_body:
+        UPSTREAM_BYTES.observe(received)
+    return response
+
+
+async def _fetch_async(url, cache, read, read_body):
+    import asyncio
+    transport_errors = _atransport_errors()
+    client = get_async_client()
+    retry_budget.deposit()
+    attempt = 0
+    while True:
+        try:
+            response = await _aget(client, url, cache.headers_for(url), read_body)
+            if response.status_code == 304:
+                await response.aclose()
+                body = cache.body_for(url)
+                if body is not None:
+                    return body
+                response = await _aget(client, url, read_body=read_body)
+            if response.status_code not in RETRY_STATUSES or attempt >= MAX_RETRIES or not retry_budget.withdraw():
+                try:
+                    _raise_for_upstream_status(response.status_code)
+                    body = await read(response)
+                finally:
+                    await response.aclose()
+                if response.is_success:
+                    cache.store(url, response, body)
+                return body
+            await response.aclose()
+        except transport_errors as e:
+            UPSTREAM_ERRORS.inc(kind=e.__class__.__name__)
+            if attempt >= MAX_RETRIES or not retry_budget.withdraw():
+                raise _unreachable(e) from e
+        UPSTREAM_RETRIES.inc()
+        await asyncio.sleep(backoff_delay(attempt))
+        attempt += 1
@@ -0,0 +1,40 @@
+import gc
+import multiprocessing
+import os
+
+# Multi-worker deployment: gunicorn picks this file up automatically (see Procfile).
+# Workers share one profile cache in shared memory and coalesce upstream fetches across
+# processes; set PROFILE_CACHE_BACKEND / SINGLEFLIGHT_LOCK_DIR to override.
+os.environ.setdefault('PROFILE_CACHE_BACKEND', 'shm')
+os.environ.setdefault('SINGLEFLIGHT_LOCK_DIR', '/dev/shm/skillrack-singleflight' if os.path.isdir('/dev/shm') else '/tmp/skillrack-singleflight')
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', min(multiprocessing.cpu_count() * 2 + 1, 8)))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+
+# Import the app (Flask, the parsers) once in the master; workers inherit it on fork
+preload_app = True
+
+# Modules the app only imports on first use (fetch.py imports requests on the first scrape, for
+# the serverless cold start), loaded up front so every worker shares them
+PRELOAD_MODULES = ('requests', 'bs4', 'numpy')
+# ASGI workers (-k uvicorn.workers.UvicornWorker) fetch with httpx instead
+ASYNC_PRELOAD_MODULES = ('httpx',)
+
+
+def on_starting(server):
+    names = PRELOAD_MODULES
+    if 'uvicorn' in server.cfg.worker_class_str.lower():
+        names += ASYNC_PRELOAD_MODULES
+    for name in names:
+        try:
+            __import__(name)
+        except ImportError:
+            pass
+
+
+def when_ready(server):
+    # Move everything loaded so far out of the collector's reach, so collections in the workers
+    # don't touch (and copy-on-write) the pages they share with the master
+    gc.freeze()
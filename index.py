@@ -1,89 +1,25 @@
-from flask import Flask, jsonify, request
-from bs4 import BeautifulSoup
-import requests
-from datetime import datetime
-from urllib.parse import unquote,urlparse, parse_qs
+from flask import Flask, Response, jsonify, request
+from urllib.parse import unquote
+from api import encode_response, error_response
+from breaker import UpstreamUnavailable
+from ratelimit import RateLimited
+from scrape import Scraper, get_profile, id_from_query
 
 app = Flask(__name__)
 
-def scrape_skillrack_profile(url):
-    response = requests.get(url)
-    soup = BeautifulSoup(response.text, 'html.parser')
-
-    # Initialize variables for the profile data
-    profile_data = {
-        'id': '',
-        'name': '',
-        'dept': '',
-        'year': '',
-        'college': '',
-        'code_tutor': 0,
-        'code_track': 0,
-        'code_test': 0,
-        'dt': 0,
-        'dc': 0,
-        'points': 0,
-        'required_points': 0,
-        'deadline': None,
-        'percentage': 100,
-        'last_fetched': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-        'url': url
-    }
-
-    # Extract profile ID from the URL
-    parsed_url = urlparse(url)
-    profile_data['id'] = parse_qs(parsed_url.query).get('id', [None])[0]
-
-    # Extract the name
-    name_div = soup.find('div', {'class': 'ui big label black'})  # Verify this selector
-    if name_div:
-        profile_data['name'] = name_div.text.strip()
-
-    # Extract department, year, and college
-    profile_div = soup.find('div', {'class': 'ui four wide center aligned column'})  # Verify this selector
-    if profile_div:
-        raw_text = profile_div.text.strip().split('\n')
-        if len(raw_text) > 8:  # Ensure the expected structure exists
-            profile_data['dept'] = raw_text[4].strip()
-            profile_data['college'] = raw_text[6].strip()
-            profile_data['year'] = raw_text[8].strip()[-4:]  # Last 4 digits as year
-
-    # Extract statistics
-    statistics_div = soup.find_all('div', class_='statistic')
-    labels_to_extract = {
-        'CODE TUTOR': 'code_tutor',
-        'CODE TEST': 'code_test',
-        'CODE TRACK': 'code_track',
-        'DC': 'dc',
-        'DT': 'dt',
-        'Points': 'points',
-        'Required Points': 'required_points',
-        'Deadline': 'deadline',
-        'Percentage': 'percentage'
-    }
-
-    for stat in statistics_div:
-        label_div = stat.find('div', class_='label')
-        if label_div:
-            label = label_div.get_text(strip=True)
-            if label in labels_to_extract:
-                value_div = stat.find('div', class_='value')
-                if value_div:
-                    value = value_div.get_text(strip=True)
-                    if label == 'Percentage':
-                        try:
-                            profile_data['percentage'] = int(value.replace('%', ''))
-                        except ValueError:
-                            profile_data['percentage'] = 100
-                    elif label == 'Deadline':
-                        profile_data['deadline'] = value if value else None
-                    else:
-                        try:
-                            profile_data[labels_to_extract[label]] = int(value)
-                        except ValueError:
-                            profile_data[labels_to_extract[label]] = value
-
-    return profile_data
+
+# Skillrack is down or overloaded (or the circuit breaker is open) with nothing cached to fall
+# back to, or the client is over its rate: same status, body and Retry-After as app.py
+@app.errorhandler(UpstreamUnavailable)
+@app.errorhandler(RateLimited)
+def upstream_unavailable(e):
+    status, data, headers = error_response(e)
+    return jsonify(data), status, headers
+
+
+# Keeps the page's deadline and counters as they are; the id comes from the ?id= query parameter.
+# Its records differ from app.py's, so they are cached under their own keys.
+scraper = Scraper(profile_id=id_from_query, derive=False, key_prefix='index:')
 
 
 # Define the API endpoint to accept a URL in the path
@@ -96,11 +32,12 @@ def get_points(encoded_url):
     if not url.startswith("http"):
         return jsonify({'error': 'Invalid URL provided'}), 400
 
-    # Scrape the data
-    data = scrape_skillrack_profile(url)
+    # Scrape the data (or serve it from the shared profile cache)
+    data = get_profile(url, scraper=scraper)
 
-    # Return the data as a JSON response
-    return jsonify(data)
+    # Return the data as a JSON response, or 304 if the client sent the current ETag
+    status, headers, body = encode_response(200, data, request.headers.get('If-None-Match'))
+    return Response(body, status=status, headers=headers)
 
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,189 @@
+import contextvars
+import heapq
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+# Opt-in request tracing: fraction of requests whose stage breakdown is kept, and how many
+# of the slowest traced requests to remember for /metrics/slowest
+TRACE_SAMPLE_RATE = float(os.environ.get('METRICS_TRACE_SAMPLE_RATE', 0))
+TRACE_KEEP_SLOWEST = int(os.environ.get('METRICS_TRACE_KEEP_SLOWEST', 20))
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576)
+
+
+def _label_text(names, values):
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+        pairs.append(f'{name}="{escaped}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+class Metric:
+    kind = 'untyped'
+
+    # With a callback the metric has no labels and its value is read at scrape time
+    def __init__(self, name, help_text, labels=(), callback=None):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.callback = callback
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(labels.get(name, '') for name in self.labels)
+
+    def samples(self):
+        if self.callback is not None:
+            return [(self.name, (), self.callback())]
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} {self.kind}']
+        for name, key, value in self.samples():
+            lines.append(f'{name}{_label_text(self.labels, key)} {value}')
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    @contextmanager
+    def track_inprogress(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+            entry[1] += 1
+            entry[2] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        bucket_names = self.labels + ('le',)
+        with self._lock:
+            values = [(key, list(entry[0]), entry[1], entry[2]) for key, entry in self._values.items()]
+        for key, counts, count, total in values:
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{_label_text(bucket_names, key + (bound,))} {bucket_count}')
+            lines.append(f'{self.name}_bucket{_label_text(bucket_names, key + ("+Inf",))} {count}')
+            lines.append(f'{self.name}_count{_label_text(self.labels, key)} {count}')
+            lines.append(f'{self.name}_sum{_label_text(self.labels, key)} {total}')
+        return '\n'.join(lines)
+
+
+REGISTRY = []
+
+STAGE_SECONDS = Histogram('skillrack_stage_seconds', 'Time spent per scrape/request stage', ('stage',))
+REQUEST_SECONDS = Histogram('skillrack_request_seconds', 'End-to-end API request latency', ('endpoint', 'status'))
+REQUESTS_IN_FLIGHT = Gauge('skillrack_requests_in_flight', 'API requests currently being served')
+UPSTREAM_IN_FLIGHT = Gauge('skillrack_upstream_in_flight', 'Upstream Skillrack fetches currently in progress')
+UPSTREAM_RESPONSES = Counter('skillrack_upstream_responses_total', 'Upstream responses by HTTP status', ('status',))
+UPSTREAM_ERRORS = Counter('skillrack_upstream_errors_total', 'Upstream fetches that failed without a response', ('kind',))
+UPSTREAM_RETRIES = Counter('skillrack_upstream_retries_total', 'Upstream fetch retries')
+UPSTREAM_BYTES = Histogram('skillrack_upstream_body_bytes', 'Size of upstream response bodies', buckets=SIZE_BUCKETS)
+
+_current_trace = contextvars.ContextVar('skillrack_trace', default=None)
+_slowest = []
+_slowest_lock = threading.Lock()
+_trace_counter = 0
+
+
+@contextmanager
+def stage(name):
+    # Times one stage into skillrack_stage_seconds and, when sampled, into the request trace
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.append((name, elapsed))
+
+
+def start_trace():
+    # Returns a token for finish_trace, or None when this request is not sampled
+    if TRACE_SAMPLE_RATE <= 0 or random.random() >= TRACE_SAMPLE_RATE:
+        return None
+    return _current_trace.set([])
+
+
+def finish_trace(token, endpoint, status, duration):
+    global _trace_counter
+    if token is None:
+        return
+    stages = _current_trace.get() or []
+    _current_trace.reset(token)
+    record = {
+        'endpoint': endpoint,
+        'status': status,
+        'duration_ms': duration * 1000,
+        'at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'stages': [{'stage': name, 'ms': elapsed * 1000} for name, elapsed in stages],
+    }
+    with _slowest_lock:
+        _trace_counter += 1
+        item = (duration, _trace_counter, record)
+        if len(_slowest) < TRACE_KEEP_SLOWEST:
+            heapq.heappush(_slowest, item)
+        elif _slowest and duration > _slowest[0][0]:
+            heapq.heapreplace(_slowest, item)
+
+
+def slowest_traces():
+    with _slowest_lock:
+        return [record for _, _, record in sorted(_slowest, reverse=True)]
+
+
+def render():
+    return '\n'.join(metric.render() for metric in REGISTRY) + '\n'
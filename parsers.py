@@ -0,0 +1,220 @@
+import os
+import sys
+from html.parser import HTMLParser
+
+# Extraction engine used when none is given: 'stream' (fast) or 'bs4' (reference)
+DEFAULT_ENGINE = os.environ.get('SKILLRACK_PARSER', 'stream')
+
+NAME_CLASS = 'ui big label black'
+PROFILE_CLASS = 'ui four wide center aligned column'
+
+# Same whitespace rules BeautifulSoup applies when building its tree
+ASCII_SPACES = '\x20\x0a\x09\x0c\x0d'
+PRESERVE_WHITESPACE_TAGS = {'pre', 'textarea'}
+SKIPPED_TEXT_TAGS = {'script', 'style', 'template'}
+
+
+# Both engines return the same raw fields; turning them into profile_data is up to the caller:
+#   name    - text of the first 'ui big label black' div, or None
+#   profile - text of the first 'ui four wide center aligned column' div, or None
+#   stats   - [(label, value)] for every 'statistic' div that has a 'label' div,
+#             value is None when the statistic has no 'value' div
+def extract_profile_bs4(html):
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, 'html.parser')
+
+    name_div = soup.find('div', {'class': NAME_CLASS})
+    profile_div = soup.find('div', {'class': PROFILE_CLASS})
+    stats = []
+    for stat in soup.find_all('div', class_='statistic'):
+        label_div = stat.find('div', class_='label')
+        if label_div:
+            value_div = stat.find('div', class_='value')
+            stats.append((label_div.get_text(strip=True), value_div.get_text(strip=True) if value_div else None))
+
+    return {
+        'name': name_div.text if name_div else None,
+        'profile': profile_div.text if profile_div else None,
+        'stats': stats,
+    }
+
+
+class _StopParsing(Exception):
+    pass
+
+
+class ProfileStreamParser(HTMLParser):
+    # Targeted tokenizer: only tracks the divs we extract from. Given the statistic labels the
+    # caller needs, it stops as soon as the name, the profile column and a statistic for each of
+    # those labels have closed (statistics can be spread over several containers, so nothing
+    # short of that is safe); without labels it reads the whole page, like bs4.
+    # Data can be fed in chunks; check .done to know when the rest of the page is not needed.
+
+    def __init__(self, labels=()):
+        super().__init__(convert_charrefs=True)
+        self._stop_early = bool(labels)
+        self._missing_labels = set(labels)
+        self.done = False
+        self._text = []
+        self._divs = []
+        self._captures = []
+        self._open_stats = []
+        self._stats = []
+        self._name = None
+        self._profile = None
+        self._name_closed = False
+        self._profile_closed = False
+        self._skip_depth = 0
+        self._preserve_depth = 0
+
+    def feed(self, data):
+        if self.done:
+            return
+        try:
+            super().feed(data)
+        except _StopParsing:
+            self.done = True
+
+    def close(self):
+        if not self.done:
+            try:
+                super().close()
+            except _StopParsing:
+                pass
+            self._flush()
+            self.done = True
+
+    def result(self):
+        stats = []
+        for label, value in self._stats:
+            if label is not None:
+                stats.append((_strip_join(label), _strip_join(value) if value is not None else None))
+        return {
+            'name': ''.join(self._name) if self._name is not None else None,
+            'profile': ''.join(self._profile) if self._profile is not None else None,
+            'stats': stats,
+        }
+
+    def _flush(self):
+        if not self._text:
+            return
+        text = ''.join(self._text)
+        self._text = []
+        if self._skip_depth or not self._captures:
+            return
+        if not self._preserve_depth and not text.strip(ASCII_SPACES):
+            text = '\n' if '\n' in text else ' '
+        for capture in self._captures:
+            capture.append(text)
+
+    def handle_data(self, data):
+        self._text.append(data)
+
+    def handle_comment(self, data):
+        self._flush()
+
+    def handle_decl(self, decl):
+        self._flush()
+
+    def handle_pi(self, data):
+        self._flush()
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        self.handle_endtag(tag)
+
+    def handle_starttag(self, tag, attrs):
+        self._flush()
+        if tag in SKIPPED_TEXT_TAGS:
+            self._skip_depth += 1
+        elif tag in PRESERVE_WHITESPACE_TAGS:
+            self._preserve_depth += 1
+        if tag != 'div':
+            return
+
+        classes = (dict(attrs).get('class') or '').split()
+        joined = ' '.join(classes)
+        entry = {'captures': [], 'stat': None}
+
+        if self._name is None and joined == NAME_CLASS:
+            self._name = []
+            entry['captures'].append(self._name)
+            entry['name'] = True
+        if self._profile is None and joined == PROFILE_CLASS:
+            self._profile = []
+            entry['captures'].append(self._profile)
+            entry['profile'] = True
+        if 'label' in classes or 'value' in classes:
+            slot = 0 if 'label' in classes else 1
+            for stat in self._open_stats:
+                if stat[slot] is None:
+                    stat[slot] = []
+                    entry['captures'].append(stat[slot])
+        if 'statistic' in classes:
+            stat = [None, None]
+            self._stats.append(stat)
+            self._open_stats.append(stat)
+            entry['stat'] = stat
+
+        self._captures.extend(entry['captures'])
+        self._divs.append(entry)
+
+    def handle_endtag(self, tag):
+        self._flush()
+        if tag in SKIPPED_TEXT_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag in PRESERVE_WHITESPACE_TAGS:
+            self._preserve_depth = max(0, self._preserve_depth - 1)
+        if tag != 'div' or not self._divs:
+            return
+
+        entry = self._divs.pop()
+        if entry['captures']:
+            self._captures = [c for c in self._captures if not any(c is e for e in entry['captures'])]
+        if entry['stat'] is not None:
+            self._open_stats = [stat for stat in self._open_stats if stat is not entry['stat']]
+            if entry['stat'][0] is not None:
+                self._missing_labels.discard(_strip_join(entry['stat'][0]))
+        self._name_closed = self._name_closed or entry.get('name', False)
+        self._profile_closed = self._profile_closed or entry.get('profile', False)
+        if self._stop_early and self._name_closed and self._profile_closed and not self._missing_labels:
+            raise _StopParsing()
+
+
+def _strip_join(parts):
+    # Equivalent of BeautifulSoup's get_text(strip=True)
+    return ''.join(part.strip() for part in parts if part.strip())
+
+
+def extract_profile_stream(html, labels=()):
+    parser = ProfileStreamParser(labels)
+    parser.feed(html)
+    parser.close()
+    return parser.result()
+
+
+ENGINES = {
+    'bs4': extract_profile_bs4,
+    'stream': extract_profile_stream,
+}
+
+
+def extract_profile(html, engine=None):
+    return ENGINES[engine or DEFAULT_ENGINE](html)
+
+
+# Regression check: every engine must agree with the bs4 reference on the saved pages
+#   python parsers.py [fixtures/profiles]
+if __name__ == '__main__':
+    fixtures_dir = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'profiles')
+    failures = 0
+    for filename in sorted(os.listdir(fixtures_dir)):
+        if not filename.endswith('.html'):
+            continue
+        with open(os.path.join(fixtures_dir, filename), encoding='utf-8') as f:
+            html = f.read()
+        expected = extract_profile_bs4(html)
+        mismatched = [engine for engine, extract in ENGINES.items() if extract(html) != expected]
+        failures += len(mismatched)
+        print(f'MISMATCH {filename} {mismatched}' if mismatched else f'ok {filename}')
+    sys.exit(1 if failures else 0)
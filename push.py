@@ -0,0 +1,103 @@
+import os
+import threading
+
+# Live profile updates (see the /api/points/stream route in asgi.py), overridable from the environment
+STREAM_MAX_SUBSCRIBERS = int(os.environ.get('STREAM_MAX_SUBSCRIBERS', 10000))
+STREAM_MAX_PROFILES = int(os.environ.get('STREAM_MAX_PROFILES', 50))
+# Comment line sent on idle streams so proxies don't time them out
+STREAM_HEARTBEAT = float(os.environ.get('STREAM_HEARTBEAT', 15))
+# A subscriber that can't take an event for this long is disconnected (it can reconnect)
+STREAM_SEND_TIMEOUT = float(os.environ.get('STREAM_SEND_TIMEOUT', 30))
+
+# Counters whose change is pushed to subscribers (besides their on-track status)
+PUSH_FIELDS = ('points', 'code_track', 'dc', 'dt')
+
+
+class Subscription:
+    # One subscriber's mailbox: the newest record per profile that it has not taken yet. A slow
+    # subscriber gets later records in place of earlier ones, so it never holds more than one
+    # pending record per profile and never slows down the scrape that published them.
+    __slots__ = ('keys', '_notify', '_pending')
+
+    def __init__(self, keys, notify):
+        self.keys = keys
+        self._notify = notify
+        self._pending = {}
+
+
+class UpdateHub:
+    # Fans each scraped profile out to the subscribers of that profile. publish() is called from
+    # the scrape path (request threads, the background refresher, the event loop); notify
+    # callbacks must be safe to call from any thread and must not block.
+
+    def __init__(self, max_subscribers=STREAM_MAX_SUBSCRIBERS):
+        self.max_subscribers = max_subscribers
+        self.published = 0
+        self.delivered = 0
+        self.conflated = 0
+        self._subscribers = {}
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def subscribe(self, keys, notify):
+        # Returns None when the process already has max_subscribers streams open
+        subscription = Subscription(tuple(dict.fromkeys(keys)), notify)
+        with self._lock:
+            if self._count >= self.max_subscribers:
+                return None
+            self._count += 1
+            for key in subscription.keys:
+                self._subscribers.setdefault(key, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._count -= 1
+            for key in subscription.keys:
+                subscribers = self._subscribers.get(key)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[key]
+
+    def offer(self, subscription, key, record):
+        # Delivers to one subscriber, e.g. the cached record it starts from
+        with self._lock:
+            self._deliver(subscription, key, record)
+        subscription._notify()
+
+    def take(self, subscription):
+        # Pending {key: record} of one subscriber, emptying its mailbox
+        with self._lock:
+            pending, subscription._pending = subscription._pending, {}
+            return pending
+
+    def publish(self, key, record):
+        if key not in self._subscribers:
+            return
+        with self._lock:
+            self.published += 1
+            subscribers = list(self._subscribers.get(key, ()))
+            for subscription in subscribers:
+                self._deliver(subscription, key, record)
+        for subscription in subscribers:
+            subscription._notify()
+
+    def _deliver(self, subscription, key, record):
+        if key in subscription._pending:
+            self.conflated += 1
+        subscription._pending[key] = record
+        self.delivered += 1
+
+    def status(self):
+        with self._lock:
+            return {
+                'subscribers': self._count,
+                'profiles': len(self._subscribers),
+                'published': self.published,
+                'delivered': self.delivered,
+                'conflated': self.conflated,
+            }
+
+
+update_hub = UpdateHub()
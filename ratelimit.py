@@ -0,0 +1,166 @@
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+from breaker import upstream_guard
+from refresher import TokenBucket
+
+# Per-client limits in front of the profile endpoints, overridable from the environment. They
+# are kept per worker process, so a client gets up to RATE_LIMIT_RPS from each worker. Off unless
+# enabled: behind a proxy or platform router every request comes from the router's address, so
+# only turn it on with API keys or with RATE_LIMIT_TRUST_FORWARDED behind a proxy that sets it.
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', '0') not in ('0', 'false', 'no', '')
+RATE_LIMIT_RPS = float(os.environ.get('RATE_LIMIT_RPS', 2))
+RATE_LIMIT_BURST = float(os.environ.get('RATE_LIMIT_BURST', 20))
+# Clients whose buckets are kept; the least recently seen one is dropped (and starts full again)
+RATE_LIMIT_MAX_CLIENTS = int(os.environ.get('RATE_LIMIT_MAX_CLIENTS', 10000))
+# Header carrying an API key; requests without one are limited per client address
+RATE_LIMIT_KEY_HEADER = os.environ.get('RATE_LIMIT_KEY_HEADER', 'X-API-Key')
+# Only behind a proxy that sets it: the first X-Forwarded-For address identifies the client
+RATE_LIMIT_TRUST_FORWARDED = os.environ.get('RATE_LIMIT_TRUST_FORWARDED', '0') not in ('0', 'false', 'no', '')
+
+# Fair queue for upstream scrapes: each client runs at most SCRAPE_MAX_PER_CLIENT at once and has
+# at most SCRAPE_MAX_QUEUED waiting, and free slots go round-robin to the clients waiting. The
+# per-client cap follows BATCH_PER_HOST (batch.py) unless set, so one client's batch or cohort
+# request still scrapes at the batch concurrency.
+SCRAPE_MAX_PER_CLIENT = int(os.environ.get('SCRAPE_MAX_PER_CLIENT', os.environ.get('BATCH_PER_HOST', 8)))
+SCRAPE_MAX_QUEUED = int(os.environ.get('SCRAPE_MAX_QUEUED', 32))
+SCRAPE_QUEUE_TIMEOUT = float(os.environ.get('SCRAPE_QUEUE_TIMEOUT', 10))
+
+
+class RateLimited(Exception):
+    # The client is over its request rate or has too many scrapes in progress
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def client_id(headers, remote_addr):
+    # headers is any mapping with .get (Flask's request.headers)
+    api_key = headers.get(RATE_LIMIT_KEY_HEADER)
+    if api_key:
+        return f'key:{api_key}'
+    if RATE_LIMIT_TRUST_FORWARDED and headers.get('X-Forwarded-For'):
+        return f'ip:{headers["X-Forwarded-For"].split(",")[0].strip()}'
+    return f'ip:{remote_addr}'
+
+
+class ClientRateLimiter:
+    # One token bucket per client
+
+    def __init__(self, rate=RATE_LIMIT_RPS, burst=RATE_LIMIT_BURST, max_clients=RATE_LIMIT_MAX_CLIENTS):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self.limited = 0
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def try_acquire(self, client, cost=1):
+        # Returns 0 when the request may go ahead, otherwise the seconds until it could
+        with self._lock:
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                if len(self._buckets) >= self.max_clients:
+                    self._buckets.popitem(last=False)
+                bucket = self._buckets[client] = TokenBucket(self.rate, self.burst)
+            else:
+                self._buckets.move_to_end(client)
+        wait = bucket.try_acquire(min(cost, self.burst))
+        if wait:
+            with self._lock:
+                self.limited += 1
+        return wait
+
+    def status(self):
+        with self._lock:
+            return {'clients': len(self._buckets), 'limited': self.limited, 'rps': self.rate, 'burst': self.burst}
+
+
+class FairQueue:
+    # Admits up to slots() scrapes at once across all clients. Waiting clients take turns in
+    # round-robin order, so a client with many queued scrapes gets one slot per turn like
+    # everyone else, and never more than per_client at once.
+
+    def __init__(self, slots, per_client=SCRAPE_MAX_PER_CLIENT, max_queued=SCRAPE_MAX_QUEUED, timeout=SCRAPE_QUEUE_TIMEOUT):
+        self.slots = slots
+        self.per_client = per_client
+        self.max_queued = max_queued
+        self.timeout = timeout
+        self.active = 0
+        self.rejected = 0
+        self._running = {}
+        self._waiting = OrderedDict()
+        self._cond = threading.Condition()
+
+    def run(self, client, fn):
+        self._enter(client)
+        try:
+            return fn()
+        finally:
+            self._leave(client)
+
+    def _enter(self, client):
+        ticket = object()
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            queue = self._waiting.get(client)
+            if queue is None:
+                queue = self._waiting[client] = deque()
+            elif len(queue) >= self.max_queued:
+                self.rejected += 1
+                raise RateLimited('Too many profile fetches queued for this client', retry_after=self.timeout)
+            queue.append(ticket)
+            while not self._is_turn(client, ticket):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    queue.remove(ticket)
+                    if not queue:
+                        del self._waiting[client]
+                    self.rejected += 1
+                    self._cond.notify_all()
+                    raise RateLimited('Timed out waiting for a profile fetch slot', retry_after=self.timeout)
+                self._cond.wait(remaining)
+            queue.popleft()
+            if queue:
+                self._waiting.move_to_end(client)
+            else:
+                del self._waiting[client]
+            self.active += 1
+            self._running[client] = self._running.get(client, 0) + 1
+            self._cond.notify_all()
+
+    def _leave(self, client):
+        with self._cond:
+            self.active -= 1
+            self._running[client] -= 1
+            if not self._running[client]:
+                del self._running[client]
+            self._cond.notify_all()
+
+    def _is_turn(self, client, ticket):
+        # The ticket is first in its client's queue, and its client is the first one (in turn
+        # order) that is still under its own limit
+        if self.active >= max(1, self.slots()) or self._waiting[client][0] is not ticket:
+            return False
+        for waiting in self._waiting:
+            if self._running.get(waiting, 0) < self.per_client:
+                return waiting == client
+        return False
+
+    def status(self):
+        with self._cond:
+            return {
+                'active': self.active,
+                'clients_waiting': len(self._waiting),
+                'waiting': sum(len(queue) for queue in self._waiting.values()),
+                'rejected': self.rejected,
+            }
+
+
+client_limiter = ClientRateLimiter()
+# Scrape slots follow the upstream concurrency limit, so clients queue here (in turn) rather than
+# inside the limiter
+scrape_queue = FairQueue(lambda: int(upstream_guard.limiter.limit))
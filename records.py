@@ -0,0 +1,158 @@
+import hashlib
+import json
+import sys
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+PROFILE_FIELDS = (
+    'id', 'name', 'dept', 'year', 'college',
+    'code_tutor', 'code_track', 'code_test', 'dt', 'dc',
+    'points', 'required_points', 'deadline', 'percentage',
+    'last_fetched', 'url', 'percentage_completed', 'stale',
+)
+# Left out of the JSON unless set: derived fields until computed, stale only on fallback copies
+OPTIONAL_FIELDS = ('percentage_completed', 'stale')
+# The stat tuple behind a record's ETag: everything the JSON carries except when it was fetched,
+# so re-scraping an unchanged profile keeps its ETag
+ETAG_FIELDS = tuple(name for name in PROFILE_FIELDS if name != 'last_fetched')
+
+
+def loads(data):
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+def dumps(data):
+    # Same shape as Flask's jsonify: sorted keys, no whitespace
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_SORT_KEYS)
+    return json.dumps(data, sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+
+class ProfileRecord:
+    # Compact, read-only view of one scraped profile. It can be read like the old profile_data
+    # dict (record['points'], record.get('dc')). Records decoded from their own JSON (the shared
+    # memory cache) reuse those bytes for responses; others encode on demand, so the records held
+    # by the in-process cache don't carry a second copy of themselves.
+    __slots__ = PROFILE_FIELDS + ('_json',)
+
+    def __init__(self, **fields):
+        for name in PROFILE_FIELDS:
+            setattr(self, name, fields.get(name))
+        self._json = None
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{name: data[name] for name in PROFILE_FIELDS if name in data})
+
+    @classmethod
+    def from_json(cls, data):
+        # From json_bytes() output, keeping those bytes as the cached encoding
+        record = cls.from_dict(loads(data))
+        record._json = bytes(data)
+        return record
+
+    def compute_derived(self):
+        self.points = (self.code_test * 30) + (self.dc * 2) + (self.dt * 20) + (self.code_track * 2)
+        self.percentage_completed = (self.points / self.required_points) * 100
+        self._json = None
+        return self
+
+    def as_stale(self):
+        # Copy marked as served from the cache while Skillrack could not be reached
+        stale = ProfileRecord.from_dict(self.to_dict())
+        stale.stale = True
+        return stale
+
+    def to_dict(self):
+        data = {}
+        for name in PROFILE_FIELDS:
+            value = getattr(self, name)
+            if value is not None or name not in OPTIONAL_FIELDS:
+                data[name] = value
+        return data
+
+    def json_bytes(self):
+        if self._json is not None:
+            return self._json
+        return dumps(self.to_dict())
+
+    def footprint(self):
+        # Approximate bytes held by the record and its field values
+        size = sys.getsizeof(self)
+        for name in PROFILE_FIELDS:
+            value = getattr(self, name)
+            if value is not None:
+                size += sys.getsizeof(value)
+        if self._json is not None:
+            size += sys.getsizeof(self._json)
+        return size
+
+    # Read-only mapping protocol, so code written against profile_data dicts keeps working
+    def keys(self):
+        return self.to_dict().keys()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __contains__(self, name):
+        return name in PROFILE_FIELDS and (getattr(self, name) is not None or name not in OPTIONAL_FIELDS)
+
+    def __getitem__(self, name):
+        if name not in self:
+            raise KeyError(name)
+        return getattr(self, name)
+
+    def get(self, name, default=None):
+        return getattr(self, name) if name in self else default
+
+    def etag(self):
+        # Weak: two bodies with the same ETag differ at most in last_fetched
+        stats = repr(tuple(getattr(self, name) for name in ETAG_FIELDS)).encode('utf-8')
+        return f'W/"{hashlib.blake2b(stats, digest_size=8).hexdigest()}"'
+
+    def __eq__(self, other):
+        if isinstance(other, ProfileRecord):
+            return self.to_dict() == other.to_dict()
+        return NotImplemented
+
+    def __repr__(self):
+        return f'ProfileRecord({self.to_dict()!r})'
+
+
+def etag_matches(if_none_match, etag):
+    # If-None-Match uses weak comparison, so W/ prefixes are ignored on both sides
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    opaque = etag[2:] if etag.startswith('W/') else etag
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if (candidate[2:] if candidate.startswith('W/') else candidate) == opaque:
+            return True
+    return False
+
+
+def dumps_profiles(profiles):
+    # Encodes a {url: record} mapping by splicing in each record's cached JSON
+    parts = [dumps(url) + b':' + profiles[url].json_bytes() for url in sorted(profiles)]
+    return b'{' + b','.join(parts) + b'}'
+
+
+def encode_value(value):
+    # For JSON-backed stores (Redis, lock-file results): keeps records distinguishable from dicts
+    if isinstance(value, ProfileRecord):
+        return {'__profile__': value.to_dict()}
+    return value
+
+
+def decode_value(value):
+    if isinstance(value, dict) and '__profile__' in value:
+        return ProfileRecord.from_dict(value['__profile__'])
+    return value
@@ -0,0 +1,204 @@
+import logging
+import math
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Background refresh settings, overridable from the environment
+REFRESHER_ENABLED = os.environ.get('REFRESHER_ENABLED', '1') not in ('0', 'false', 'no', '')
+REFRESHER_RPS = float(os.environ.get('REFRESHER_RPS', 1))
+REFRESHER_WORKERS = int(os.environ.get('REFRESHER_WORKERS', 2))
+REFRESHER_MAX_PROFILES = int(os.environ.get('REFRESHER_MAX_PROFILES', 5000))
+# Refresh once a cached profile reaches this fraction of its TTL, so readers never see it expire
+REFRESHER_AHEAD = float(os.environ.get('REFRESHER_AHEAD', 0.8))
+# Profiles nobody asked for in this long are dropped from the registry
+REFRESHER_IDLE_EXPIRY = float(os.environ.get('REFRESHER_IDLE_EXPIRY', 3 * 24 * 3600))
+# Access counts halve every REFRESHER_HALF_LIFE seconds
+REFRESHER_HALF_LIFE = float(os.environ.get('REFRESHER_HALF_LIFE', 3600))
+
+
+class TokenBucket:
+    # Allows `rate` operations per second with bursts of up to `capacity`
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, tokens=1):
+        # Returns 0 when the tokens were taken, otherwise the seconds until they will be available
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return 0
+            return (tokens - self.tokens) / self.rate
+
+    def acquire(self, stop_event=None):
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return True
+            if stop_event is not None:
+                if stop_event.wait(wait):
+                    return False
+            else:
+                time.sleep(wait)
+
+
+class _Tracked:
+    __slots__ = ('url', 'score', 'accessed', 'fetched', 'next_attempt', 'failures', 'busy')
+
+    def __init__(self, url, now):
+        self.url = url
+        self.score = 0.0
+        self.accessed = now
+        self.fetched = 0.0
+        self.next_attempt = 0.0
+        self.failures = 0
+        self.busy = False
+
+
+class Refresher:
+    # Keeps tracked profiles warm: picks the stalest, most requested profile that is due and
+    # refreshes it, never exceeding the requests-per-second budget toward Skillrack. age(key), when
+    # given, reports how old the cached copy is; with a cache shared across workers, a profile
+    # another worker's refresher (or a request) just fetched is skipped rather than fetched again.
+
+    def __init__(self, refresh, ttl, rps=REFRESHER_RPS, workers=REFRESHER_WORKERS, max_profiles=REFRESHER_MAX_PROFILES, age=None):
+        self.refresh = refresh
+        self.ttl = ttl
+        self.age = age
+        self.workers = workers
+        self.max_profiles = max_profiles
+        self.bucket = TokenBucket(rps)
+        self.refreshed = 0
+        self.skipped = 0
+        self.failed = 0
+        self._tracked = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._pid = None
+
+    def touch(self, key, url, prefetch=False):
+        # Called on every interactive lookup: registers the profile and bumps its popularity.
+        # With prefetch, a newly registered profile is fetched right away instead of after a TTL.
+        now = time.time()
+        with self._lock:
+            entry = self._tracked.get(key)
+            if entry is None:
+                if len(self._tracked) >= self.max_profiles:
+                    self._evict_one()
+                entry = self._tracked[key] = _Tracked(url, now)
+                if not prefetch:
+                    entry.fetched = now
+            entry.score = self._decayed(entry, now) + 1
+            entry.accessed = now
+        self._ensure_started()
+        if prefetch:
+            self._wake.set()
+
+    def mark_fetched(self, key):
+        # Any scrape of the profile (interactive or background) resets its staleness
+        with self._lock:
+            entry = self._tracked.get(key)
+            if entry is not None:
+                entry.fetched = time.time()
+
+    def status(self):
+        with self._lock:
+            tracked = len(self._tracked)
+            due = sum(1 for entry in self._tracked.values() if self._is_due(entry, time.time()))
+        return {
+            'enabled': self._pid == os.getpid(),
+            'tracked': tracked,
+            'due': due,
+            'refreshed': self.refreshed,
+            'skipped': self.skipped,
+            'failed': self.failed,
+            'rps_budget': self.bucket.rate,
+        }
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def _decayed(self, entry, now):
+        return entry.score * math.pow(0.5, (now - entry.accessed) / REFRESHER_HALF_LIFE)
+
+    def _is_due(self, entry, now):
+        return not entry.busy and now >= entry.next_attempt and now - entry.fetched >= self.ttl * REFRESHER_AHEAD
+
+    def _evict_one(self):
+        key = min(self._tracked, key=lambda k: self._tracked[k].accessed)
+        del self._tracked[key]
+
+    def _ensure_started(self):
+        # Threads don't survive fork, so each worker process starts its own
+        if self._pid == os.getpid() or self.ttl <= 0:
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        for i in range(self.workers):
+            threading.Thread(target=self._run, name=f'refresher-{i}', daemon=True).start()
+
+    def _next_due(self):
+        now = time.time()
+        best_key, best_priority = None, 0
+        with self._lock:
+            for key, entry in list(self._tracked.items()):
+                if now - entry.accessed > REFRESHER_IDLE_EXPIRY:
+                    del self._tracked[key]
+                    continue
+                if not self._is_due(entry, now):
+                    continue
+                # Staler and more popular profiles go first
+                priority = (now - entry.fetched) / self.ttl * (1 + math.log1p(self._decayed(entry, now)))
+                if priority > best_priority:
+                    best_key, best_priority = key, priority
+            if best_key is None:
+                return None, None
+            entry = self._tracked[best_key]
+            entry.busy = True
+            return best_key, entry
+
+    def _run(self):
+        while not self._stop.is_set():
+            key, entry = self._next_due()
+            if key is None:
+                self._wake.wait(min(self.ttl * (1 - REFRESHER_AHEAD), 30) or 1)
+                self._wake.clear()
+                continue
+            try:
+                age = self.age(key) if self.age is not None else None
+                if age is not None and age < self.ttl * REFRESHER_AHEAD:
+                    # Fetched elsewhere since: catch up without spending a token on it
+                    entry.fetched = time.time() - age
+                    self.skipped += 1
+                    continue
+                if not self.bucket.acquire(self._stop):
+                    return
+                self.refresh(key, entry.url)
+                entry.fetched = time.time()
+                entry.failures = 0
+                self.refreshed += 1
+            except Exception:
+                # Back off this profile exponentially; interactive requests can still fetch it
+                entry.failures += 1
+                entry.next_attempt = time.time() + min(self.ttl, 30 * 2 ** entry.failures)
+                self.failed += 1
+                logger.warning('Background refresh of %s failed', key, exc_info=True)
+            finally:
+                entry.busy = False
@@ -0,0 +1,235 @@
+from datetime import datetime
+from urllib.parse import parse_qs, urlparse
+
+from breaker import UpstreamUnavailable
+from cache import normalize_profile_key, profile_cache
+from cohort import is_on_track
+from fetch import STREAM_EXTRACT, fetch_extracted, fetch_page
+from metrics import stage
+from parsers import extract_profile
+from push import update_hub
+from ratelimit import RateLimited, scrape_queue
+from records import ProfileRecord
+from refresher import REFRESHER_ENABLED, Refresher
+from singleflight import profile_flight
+
+# Flask-free scrape pipeline behind app.py, asgi.py, serverless.py and index.py: the scraper
+# engine, caching and background refresh of profiles, plus the on-track calculation
+
+
+def _int_or_text(value):
+    # Counters are numbers, but keep whatever the page shows (e.g. 'None') rather than fail
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+
+def _percentage(value):
+    try:
+        return int(value.replace('%', ''))
+    except ValueError:
+        return 100
+
+
+def _deadline(value):
+    return value if value else None
+
+
+# Statistic label on the profile page -> (profile field, converter for the value text). The
+# parser collects every statistic in its single pass; adding a field is one entry here
+STAT_EXTRACTORS = {
+    'CODE TUTOR': ('code_tutor', _int_or_text),
+    'CODE TEST': ('code_test', _int_or_text),
+    'CODE TRACK': ('code_track', _int_or_text),
+    'DC': ('dc', _int_or_text),
+    'DT': ('dt', _int_or_text),
+    'Points': ('points', _int_or_text),
+    'Required Points': ('required_points', _int_or_text),
+    'Deadline': ('deadline', _deadline),
+    'Percentage': ('percentage', _percentage),
+}
+
+# Line of the profile column text -> (profile field, converter)
+PROFILE_LINE_EXTRACTORS = {
+    4: ('dept', str.strip),
+    6: ('college', str.strip),
+    8: ('year', lambda line: line.strip()[-4:]),  # Last 4 digits as year
+}
+
+# Fields the page doesn't provide keep these defaults
+DEFAULT_FIELDS = {
+    'id': '',
+    'name': '',
+    'dept': '',
+    'year': '',
+    'college': '',
+    'code_tutor': 0,
+    'code_track': 0,
+    'code_test': 0,
+    'dt': 0,
+    'dc': 0,
+    'points': 0,
+    'required_points': 0,
+    'deadline': None,
+    'percentage': 100,
+}
+
+
+def id_from_path(url):
+    return url.split('/')[4]
+
+
+def id_from_query(url):
+    return parse_qs(urlparse(url).query).get('id', [None])[0]
+
+
+class Scraper:
+    # The one scrape engine behind every entry point; they differ only in record defaults, fields
+    # they keep fixed instead of reading from the page, how the id is read from the link, and
+    # whether points/percentage_completed are recomputed from the counters. Records of scrapers
+    # with different settings are cached (and recorded) under their own key_prefix.
+
+    def __init__(self, defaults=None, ignore=(), profile_id=id_from_path, derive=True, key_prefix=''):
+        self.defaults = dict(DEFAULT_FIELDS, **(defaults or {}))
+        self.stat_extractors = {label: extractor for label, extractor in STAT_EXTRACTORS.items()
+                                if extractor[0] not in ignore}
+        self.profile_id = profile_id
+        self.derive = derive
+        self.key_prefix = key_prefix
+
+    def scrape(self, url):
+        # Streaming mode parses while downloading and hangs up once the profile fields are in
+        if STREAM_EXTRACT:
+            return self.from_extracted(url, fetch_extracted(url, self.stat_extractors))
+        return self.from_extracted(url, fetch_page(url, extract_profile))
+
+    def from_html(self, url, html, engine=None):
+        with stage('parse'):
+            extracted = extract_profile(html, engine)
+        return self.from_extracted(url, extracted)
+
+    def from_extracted(self, url, extracted):
+        profile_data = ProfileRecord(
+            last_fetched=datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            url=url,
+            **self.defaults
+        )
+
+        if extracted['name'] is not None:
+            profile_data.name = extracted['name'].strip()
+
+        if extracted['profile'] is not None:
+            lines = extracted['profile'].strip().split('\n')
+            if len(lines) > max(PROFILE_LINE_EXTRACTORS):  # Ensure the expected structure exists
+                for index, (field, convert) in PROFILE_LINE_EXTRACTORS.items():
+                    setattr(profile_data, field, convert(lines[index]))
+
+        for label, value in extracted['stats']:
+            extractor = self.stat_extractors.get(label)
+            if extractor is not None and value is not None:
+                field, convert = extractor
+                setattr(profile_data, field, convert(value))
+
+        if self.derive:
+            # Points and percentage_completed are computed once here and travel with the cached record
+            profile_data.compute_derived()
+        profile_data.id = self.profile_id(url)
+        return profile_data
+
+
+# app.py, asgi.py and serverless.py: the deadline and required points are fixed for the
+# current term, and points are recomputed from the counters
+profile_scraper = Scraper(defaults={'required_points': 5000, 'deadline': '30-04-2024'}, ignore=('deadline',))
+
+
+def scrape_skillrack_profile(url):
+    return profile_scraper.scrape(url)
+
+
+def build_profile_data(url, html, engine=None):
+    return profile_scraper.from_html(url, html, engine)
+
+
+def profile_from_extracted(url, extracted):
+    return profile_scraper.from_extracted(url, extracted)
+
+
+# Scrape a profile and keep a snapshot of its counters for the history endpoints
+def fetch_profile(key, url, scraper=profile_scraper):
+    # sqlite3 is only imported once a profile is actually scraped
+    from snapshots import record_snapshot
+
+    profile_data = scraper.scrape(url)
+    record_snapshot(key, profile_data)
+    update_hub.publish(key, profile_data)
+    if profile_refresher is not None:
+        profile_refresher.mark_fetched(key)
+    return profile_data
+
+
+# Serve repeat lookups of the same profile from the cache instead of re-scraping,
+# and let concurrent misses for the same profile share one upstream fetch. With a client,
+# the fetch waits for that client's turn in the fair scrape queue.
+def get_profile(url, client=None, scraper=profile_scraper):
+    key = scraper.key_prefix + normalize_profile_key(url)
+    # The background refresher re-scrapes with profile_scraper only
+    if profile_refresher is not None and scraper is profile_scraper:
+        profile_refresher.touch(key, url)
+    scrape = lambda: fetch_profile(key, url, scraper)
+    if client is not None:
+        scrape = lambda: scrape_queue.run(client, lambda: fresh_or_fetch(key, url, scraper))
+    try:
+        # The queue sits inside the flight, so lookups from any client join a fetch that is
+        # still waiting for its turn instead of queueing (and scraping) on their own
+        return profile_cache.get_or_fetch(key, lambda: profile_flight.do(key, scrape))
+    except (UpstreamUnavailable, RateLimited):
+        # Skillrack is failing (or the circuit is open), or the client's turn to scrape never
+        # came: fall back to the last data we have
+        cached = profile_cache.last_known(key)
+        if cached is None:
+            raise
+        return cached.as_stale()
+
+
+# A fetch that waited its turn in the fair queue: another flight for the profile may have
+# filled the cache meanwhile, and that copy is used instead of scraping again
+def fresh_or_fetch(key, url, scraper=profile_scraper):
+    cached, stale = profile_cache.peek(key)
+    if cached is not None and not stale:
+        return cached
+    return fetch_profile(key, url, scraper)
+
+
+# Whatever is cached for a profile without scraping it, marked stale once past its TTL
+def cached_profile(url):
+    cached, stale = profile_cache.peek(normalize_profile_key(url))
+    if cached is not None and stale:
+        return cached.as_stale()
+    return cached
+
+
+# Used by the background refresher to re-scrape a tracked profile ahead of demand
+def refresh_profile(key, url):
+    profile_cache.put(key, profile_flight.do(key, lambda: fetch_profile(key, url)))
+
+
+profile_refresher = Refresher(refresh_profile, profile_cache.ttl, age=profile_cache.age) if REFRESHER_ENABLED else None
+
+
+# Add the on-track status for a dd-mm-yyyy lastdate (raises ValueError for a bad date)
+def add_track_status(profile_data, lastdate):
+    # Parse the lastdate and calculate days left until deadline
+    lastdate_obj = datetime.strptime(lastdate, '%d-%m-%Y')
+    today = datetime.now()
+    days_left = (lastdate_obj - today).days
+
+    # Each day, the user can complete a code_track (2 points) and 1 DC (2 points); the cohort
+    # endpoint uses the same rule
+    if is_on_track(days_left, profile_data['points'], profile_data['required_points']):
+        profile_data['status'] = 'On Track to Complete'
+        profile_data['estimated_completion_date'] = lastdate
+    else:
+        profile_data['status'] = 'Not on Track'
+        profile_data['estimated_completion_date'] = today.strftime('%d-%m-%Y')
+    return profile_data
@@ -0,0 +1,105 @@
+import argparse
+import logging
+import os
+import sys
+import time
+from http import HTTPStatus
+
+from api import MAX_BODY_BYTES, encode_response, error_response, parse_json_body, points_request, track_request, track_response
+from cache import normalize_profile_key, profile_cache
+from metrics import REQUEST_SECONDS
+from scrape import get_profile
+
+logger = logging.getLogger(__name__)
+
+# Cold-start optimized WSGI entry point for Vercel (see vercel.json). The two profile routes are
+# answered here without importing Flask, and requests is only imported once a profile really has
+# to be scraped. Every other route goes to the full Flask app in app.py, imported on first use.
+#   python -m bench.coldstart    shows where cold-start time goes
+# Optional JSON-lines snapshot of profiles loaded into the cache at boot, built at deploy time with
+#   python serverless.py --warm-cache warm_cache.jsonl --urls urls.txt
+WARM_CACHE_FILE = os.environ.get('WARM_CACHE_FILE', '')
+
+
+def get_points(request_data):
+    url, error = points_request(request_data)
+    if error:
+        return error
+    return 200, get_profile(url)
+
+
+def track_with_buddy(request_data):
+    url, lastdate, error = track_request(request_data)
+    if error:
+        return error
+    return track_response(get_profile(url), lastdate)
+
+
+ROUTES = {
+    '/api/points': get_points,
+    '/api/trackwithbuddy': track_with_buddy,
+}
+
+
+def read_json(environ):
+    try:
+        length = int(environ.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        return None
+    if not length or length > MAX_BODY_BYTES:
+        return None
+    return parse_json_body(environ['wsgi.input'].read(length))
+
+
+def flask_app():
+    from app import app as full_app
+    return full_app
+
+
+def app(environ, start_response):
+    handler = ROUTES.get(environ.get('PATH_INFO', ''))
+    if handler is None or environ.get('REQUEST_METHOD') != 'POST':
+        return flask_app()(environ, start_response)
+
+    started = time.perf_counter()
+    headers = []
+    try:
+        status, data = handler(read_json(environ))
+    except Exception as e:
+        status, data, headers = error_response(e)
+
+    status, headers, body = encode_response(status, data, environ.get('HTTP_IF_NONE_MATCH'), headers)
+    start_response(f'{status} {HTTPStatus(status).phrase}', headers)
+    REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=handler.__name__, status=status)
+    return [body]
+
+
+if WARM_CACHE_FILE and __name__ != '__main__':
+    try:
+        profile_cache.restore_snapshot(WARM_CACHE_FILE)
+    except (OSError, ValueError, KeyError):
+        # A missing or broken snapshot only costs the warm start
+        logger.exception('Could not restore the warm cache from %s', WARM_CACHE_FILE)
+
+
+def build_warm_cache(path, urls):
+    from batch import fetch_many
+
+    keys = []
+    for url, _, error in fetch_many(urls, get_profile):
+        if error is None:
+            keys.append(normalize_profile_key(url))
+        else:
+            print(f'skipped {url}: {error}', file=sys.stderr)
+    return profile_cache.save_snapshot(path, keys)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Scrape profiles into a warm cache snapshot for WARM_CACHE_FILE')
+    parser.add_argument('--warm-cache', required=True, help='snapshot file to write')
+    parser.add_argument('--urls', required=True, help='file with one profile URL per line')
+    args = parser.parse_args()
+
+    with open(args.urls, encoding='utf-8') as f:
+        urls = [line.strip() for line in f if line.strip().startswith('http')]
+    print(f'wrote {build_warm_cache(args.warm_cache, urls)} of {len(urls)} profiles to {args.warm_cache}')
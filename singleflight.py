@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+from records import decode_value, encode_value
+
+# Directory for cross-worker lock files; leave unset to coalesce within one worker only
+LOCK_DIR = os.environ.get('SINGLEFLIGHT_LOCK_DIR', '')
+# Keys are spread over this many lock files, so the directory stays the same size however many
+# profiles are looked up
+LOCK_STRIPES = int(os.environ.get('SINGLEFLIGHT_LOCK_STRIPES', 256))
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+def _share(value):
+    # Every caller gets its own copy of a dict result, so callers can annotate it freely
+    return dict(value) if isinstance(value, dict) else value
+
+
+class SingleFlight:
+    # Concurrent callers asking for the same key wait on one in-flight call and share its result
+
+    def __init__(self, lock_dir=LOCK_DIR, stripes=LOCK_STRIPES):
+        self.lock_dir = lock_dir
+        self.stripes = max(1, stripes)
+        self.coalesced = 0
+        self._calls = {}
+        self._async_calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return _share(call.value)
+
+        try:
+            call.value = self._do_across_workers(key, fn) if self.lock_dir else fn()
+            return call.value
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    async def ado(self, key, fn):
+        # Event-loop version of do(); fn returns an awaitable
+        import asyncio
+
+        future = self._async_calls.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return _share(await asyncio.shield(future))
+
+        future = asyncio.get_running_loop().create_future()
+        self._async_calls[key] = future
+        try:
+            value = await fn()
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody else was waiting on it
+            future.exception()
+            raise
+        else:
+            future.set_result(value)
+            return value
+        finally:
+            del self._async_calls[key]
+            if not future.done():
+                future.cancel()
+
+    def _lock_path(self, key):
+        stripe = int.from_bytes(hashlib.sha1(key.encode('utf-8')).digest()[:8], 'little') % self.stripes
+        return os.path.join(self.lock_dir, f'{stripe}.lock')
+
+    def _do_across_workers(self, key, fn):
+        # The key's lock file (one of a fixed set of stripes) serializes workers. The holder leaves
+        # its result in the lock file itself, and a worker that waited on the lock reuses it when
+        # it is for the same key and finished after we started waiting. Keys sharing a stripe
+        # only wait for each other, and the next result on the stripe replaces the last one.
+        import fcntl
+
+        os.makedirs(self.lock_dir, exist_ok=True)
+        started = time.time()
+        with open(self._lock_path(key), 'a+') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                try:
+                    lock_file.seek(0)
+                    entry = json.loads(lock_file.read())
+                    if entry['key'] == key and entry['finished_at'] >= started:
+                        self.coalesced += 1
+                        return decode_value(entry['value'])
+                except (OSError, ValueError, KeyError):
+                    pass
+
+                value = fn()
+                lock_file.truncate(0)
+                json.dump({'key': key, 'finished_at': time.time(), 'value': encode_value(value)}, lock_file, default=str)
+                lock_file.flush()
+                return value
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+profile_flight = SingleFlight()
@@ -0,0 +1,185 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# SQLite file for profile history; set SNAPSHOT_DB to an empty string to disable recording
+SNAPSHOT_DB = os.environ.get('SNAPSHOT_DB', 'snapshots.db')
+
+COUNTERS = ('code_tutor', 'code_track', 'code_test', 'dt', 'dc', 'points')
+# SQLite's default limit on host parameters per statement is 999 on older builds
+QUERY_CHUNK = 500
+
+SCHEMA = f'''
+CREATE TABLE IF NOT EXISTS snapshots (
+    profile_key TEXT NOT NULL,
+    profile_id TEXT,
+    fetched_at TEXT NOT NULL,
+    {', '.join(f'{name} INTEGER' for name in COUNTERS)}
+);
+CREATE INDEX IF NOT EXISTS snapshots_profile_time ON snapshots (profile_key, fetched_at);
+CREATE TABLE IF NOT EXISTS groups (
+    group_id TEXT PRIMARY KEY,
+    urls TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+'''
+
+# Inserts the snapshot unless the profile's latest row has the same counters (IS also matches NULLs)
+RECORD_SNAPSHOT = f'''
+INSERT INTO snapshots (profile_key, profile_id, fetched_at, {', '.join(COUNTERS)})
+SELECT ?, ?, ?, {', '.join('?' * len(COUNTERS))}
+WHERE NOT EXISTS (
+    SELECT 1 FROM (
+        SELECT {', '.join(COUNTERS)} FROM snapshots WHERE profile_key = ? ORDER BY fetched_at DESC, rowid DESC LIMIT 1
+    ) AS latest
+    WHERE {' AND '.join(f'latest.{name} IS ?' for name in COUNTERS)}
+)
+'''
+
+
+class SnapshotStore:
+    # Append-only history of profile counters; a row is written only when a counter changed
+
+    def __init__(self, path=SNAPSHOT_DB):
+        self.path = path
+        self._local = threading.local()
+        self._schema_ready = False
+        self._usable = None
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            if not self._schema_ready:
+                conn.executescript(SCHEMA)
+                self._schema_ready = True
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def usable(self):
+        # False when the database can't be opened (e.g. SNAPSHOT_DB on a read-only filesystem such
+        # as a serverless bundle); checked once per process
+        if self._usable is None:
+            try:
+                self._connection()
+                self._usable = True
+            except sqlite3.Error:
+                logger.exception('Snapshot store disabled: could not open %s', self.path)
+                self._usable = False
+        return self._usable
+
+    def record(self, profile_key, profile_data):
+        # Returns True when a new snapshot was written. The comparison with the profile's latest
+        # row happens in the database, inside one write transaction, so gunicorn workers (and
+        # restarts) recording the same counters leave a single row
+        counters = tuple(profile_data.get(name) for name in COUNTERS)
+        conn = self._connection()
+        # IMMEDIATE takes the write lock before the latest row is read, so two workers can't both
+        # find it unchanged
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            inserted = conn.execute(RECORD_SNAPSHOT, (profile_key, profile_data.get('id'), profile_data.get('last_fetched'),
+                                                      *counters, profile_key, *counters)).rowcount
+        return inserted > 0
+
+    def history(self, profile_key, since=None, until=None, limit=1000):
+        query = f'SELECT fetched_at, {", ".join(COUNTERS)} FROM snapshots WHERE profile_key = ?'
+        params = [profile_key]
+        if since:
+            query += ' AND fetched_at >= ?'
+            params.append(since)
+        if until:
+            query += ' AND fetched_at <= ?'
+            params.append(until + ' 23:59:59' if len(until) == 10 else until)
+        query += ' ORDER BY fetched_at, rowid LIMIT ?'
+        params.append(limit)
+        return [dict(row) for row in self._connection().execute(query, params)]
+
+    def version(self):
+        # Snapshot rowids only grow, so the highest one versions the whole history
+        return self._connection().execute('SELECT COALESCE(MAX(rowid), 0) FROM snapshots').fetchone()[0]
+
+    def changes(self, profile_keys, since=None):
+        # Latest snapshot of each profile whose counters moved after `since`, which is a version
+        # from an earlier call (int) or a fetched_at stamp (str); returns (version, {key: row})
+        conn = self._connection()
+        version = self.version()
+        changed = {}
+        profile_keys = list(dict.fromkeys(profile_keys))
+        for start in range(0, len(profile_keys), QUERY_CHUNK):
+            chunk = profile_keys[start:start + QUERY_CHUNK]
+            query = (f'SELECT rowid AS version, profile_key, fetched_at, {", ".join(COUNTERS)} FROM snapshots '
+                     f'WHERE profile_key IN ({", ".join("?" * len(chunk))}) AND rowid <= ?')
+            params = [*chunk, version]
+            if isinstance(since, int):
+                query += ' AND rowid > ?'
+                params.append(since)
+            elif since:
+                query += ' AND fetched_at > ?'
+                params.append(since)
+            for row in conn.execute(query + ' ORDER BY rowid', params):
+                changed[row['profile_key']] = dict(row)
+        return version, changed
+
+    def save_group(self, group_id, urls):
+        # Named list of profile URLs (e.g. a class section) for the cohort endpoint
+        with self._connection() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO groups (group_id, urls, updated_at) VALUES (?, ?, ?)',
+                (group_id, json.dumps(urls), datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+
+    def load_group(self, group_id):
+        row = self._connection().execute('SELECT urls FROM groups WHERE group_id = ?', (group_id,)).fetchone()
+        return json.loads(row['urls']) if row else None
+
+    def daily_deltas(self, profile_key, since=None, until=None):
+        # Last snapshot of each day, with the change since the previous recorded day
+        last_per_day = {}
+        for row in self.history(profile_key, since, until, limit=-1):
+            last_per_day[row['fetched_at'][:10]] = row
+
+        days = []
+        previous = None
+        for day, row in last_per_day.items():
+            delta = {}
+            for name in COUNTERS:
+                if previous is not None and isinstance(row[name], int) and isinstance(previous[name], int):
+                    delta[name] = row[name] - previous[name]
+                else:
+                    delta[name] = None
+            days.append({'date': day, **{name: row[name] for name in COUNTERS}, 'delta': delta})
+            previous = row
+        return days
+
+
+def validate_day(value):
+    # Accepts YYYY-MM-DD (or a full 'YYYY-MM-DD HH:MM:SS' stamp); raises ValueError otherwise
+    if value is None:
+        return None
+    datetime.strptime(value[:10], '%Y-%m-%d')
+    return value
+
+
+snapshot_store = SnapshotStore() if SNAPSHOT_DB else None
+
+
+def store_enabled():
+    return snapshot_store is not None and snapshot_store.usable()
+
+
+def record_snapshot(profile_key, profile_data):
+    # History is best effort: a storage problem must never fail the scrape that produced the data
+    if not store_enabled():
+        return
+    try:
+        snapshot_store.record(profile_key, profile_data)
+    except sqlite3.Error:
+        logger.exception('Could not record snapshot for %s', profile_key)
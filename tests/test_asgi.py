@@ -0,0 +1,54 @@
+import asyncio
+
+import httpx
+import pytest
+
+import asgi
+from breaker import UpstreamUnavailable
+
+
+def request(method, path, **kwargs):
+    async def send():
+        transport = httpx.ASGITransport(app=asgi.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://testserver') as client:
+            return await client.request(method, path, **kwargs)
+    return asyncio.run(send())
+
+
+def failing(error):
+    async def handler(request_data):
+        raise error
+    return handler
+
+
+@pytest.mark.parametrize('error, status', [
+    (UpstreamUnavailable('Skillrack is unavailable (circuit open)', retry_after=12.2), 503),
+    (RuntimeError('boom'), 500),
+])
+def test_errors_get_app_py_statuses(monkeypatch, error, status):
+    monkeypatch.setitem(asgi.ROUTES, '/api/points', failing(error))
+    response = request('POST', '/api/points', json={'url': 'https://www.skillrack.com/profile/1/abc'})
+    assert response.status_code == status
+    assert 'error' in response.json()
+    if status == 503:
+        assert response.headers['Retry-After'] == '12'
+
+
+def test_bad_request_is_answered_natively():
+    response = request('POST', '/api/trackwithbuddy', json={'url': 'https://www.skillrack.com/profile/1/abc'})
+    assert response.status_code == 400
+    assert response.json() == {'error': 'Both URL and lastdate are required'}
+
+
+def test_other_routes_go_to_the_flask_app(monkeypatch):
+    seen = []
+
+    async def flask_app(scope, receive, send):
+        seen.append((scope['method'], scope['path']))
+        await send({'type': 'http.response.start', 'status': 204, 'headers': []})
+        await send({'type': 'http.response.body', 'body': b''})
+
+    monkeypatch.setattr(asgi, '_flask_app', flask_app)
+    assert request('POST', '/api/points/batch', json={'urls': []}).status_code == 204
+    assert request('GET', '/api/points').status_code == 204
+    assert seen == [('POST', '/api/points/batch'), ('GET', '/api/points')]
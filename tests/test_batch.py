@@ -0,0 +1,58 @@
+import threading
+import time
+
+import batch
+
+
+def slow_fetch(url):
+    time.sleep(0.05)
+    return {'url': url}
+
+
+def test_results_and_errors_for_every_url():
+    def fetch(url):
+        if url.endswith('bad'):
+            raise ValueError('no profile')
+        return {'url': url}
+
+    urls = [f'https://www.skillrack.com/profile/{n}/abc' for n in range(20)] + ['https://www.skillrack.com/profile/0/bad']
+    results = {url: (data, error) for url, data, error in batch.fetch_many(urls + urls[:3], fetch)}
+    assert len(results) == 21
+    assert results[urls[5]] == ({'url': urls[5]}, None)
+    assert results['https://www.skillrack.com/profile/0/bad'] == (None, 'no profile')
+
+
+def test_a_large_batch_does_not_hold_up_another_clients_batch():
+    big = [f'https://www.skillrack.com/profile/{n}/big' for n in range(64)]
+    small = [f'https://www.skillrack.com/profile/{n}/small' for n in range(2)]
+    big_done = []
+    big_thread = threading.Thread(target=lambda: big_done.extend(batch.fetch_many(big, slow_fetch)))
+    big_thread.start()
+    time.sleep(0.02)
+
+    started = time.monotonic()
+    assert len(list(batch.fetch_many(small, slow_fetch))) == 2
+    small_seconds = time.monotonic() - started
+    big_finished_meanwhile = len(big_done)
+    big_thread.join(10)
+
+    assert len(big_done) == 64
+    # The small batch ran alongside the big one instead of after most of it
+    assert small_seconds < 0.5
+    assert big_finished_meanwhile < 32
+
+
+def test_stopping_early_leaves_nothing_queued():
+    calls = []
+
+    def fetch(url):
+        calls.append(url)
+        time.sleep(0.02)
+        return {}
+
+    urls = [f'https://www.skillrack.com/profile/{n}/abc' for n in range(100)]
+    results = batch.fetch_many(urls, fetch, window=4)
+    next(results)
+    results.close()
+    time.sleep(0.1)
+    assert len(calls) <= 8
@@ -0,0 +1,98 @@
+import time
+
+import pytest
+
+from breaker import CLOSED, HALF_OPEN, OPEN, AdaptiveLimiter, CircuitBreaker, CircuitOpenError, UpstreamGuard, UpstreamUnavailable
+
+
+def breaker(**settings):
+    defaults = dict(window=30, min_calls=4, error_rate=0.5, slow_call_seconds=5, slow_call_rate=0.8,
+                    open_seconds=0.05, half_open_probes=1)
+    return CircuitBreaker(**dict(defaults, **settings))
+
+
+def test_opens_once_enough_calls_fail():
+    circuit = breaker()
+    for ok in (True, False, True):
+        circuit.record(ok, 0.1)
+    assert circuit.state == CLOSED
+    circuit.record(False, 0.1)
+    assert circuit.state == OPEN
+    with pytest.raises(CircuitOpenError) as raised:
+        circuit.before_call()
+    assert 0 < raised.value.retry_after <= 0.05
+    assert circuit.status()['rejected'] == 1
+
+
+def test_opens_on_slow_calls():
+    circuit = breaker()
+    for _ in range(4):
+        circuit.record(True, 6)
+    assert circuit.state == OPEN
+
+
+def test_stays_closed_below_min_calls():
+    circuit = breaker()
+    for _ in range(3):
+        circuit.record(False, 0.1)
+    assert circuit.state == CLOSED
+
+
+def trip(circuit):
+    for _ in range(4):
+        circuit.record(False, 0.1)
+    time.sleep(0.06)
+
+
+def test_half_open_probe_closes_the_circuit():
+    circuit = breaker()
+    trip(circuit)
+    assert circuit.before_call() is True
+    assert circuit.state == HALF_OPEN
+    # Only one probe at a time
+    with pytest.raises(CircuitOpenError):
+        circuit.before_call()
+    circuit.record(True, 0.1)
+    assert circuit.state == CLOSED
+    assert circuit.before_call() is False
+
+
+def test_failed_probe_opens_the_circuit_again():
+    circuit = breaker()
+    trip(circuit)
+    circuit.before_call()
+    circuit.record(False, 0.1)
+    assert circuit.state == OPEN
+    assert circuit.trips == 2
+
+
+def test_limiter_backs_off_on_errors_and_grows_while_used():
+    limiter = AdaptiveLimiter(initial=10, minimum=1, maximum=20, latency_target=2, backoff=0.5)
+    assert limiter.acquire()
+    limiter.release(False, 0.1)
+    assert limiter.status()['limit'] == 5
+    for _ in range(5):
+        assert limiter.acquire()
+    for _ in range(5):
+        limiter.release(True, 0.1)
+    assert limiter.limit > 5
+
+
+def test_limiter_rejects_after_the_queue_timeout():
+    limiter = AdaptiveLimiter(initial=1, minimum=1, maximum=1)
+    assert limiter.acquire()
+    assert not limiter.acquire(timeout=0.02)
+    assert limiter.status() == {'limit': 1, 'in_flight': 1, 'rejected': 1}
+
+
+def test_guard_counts_failures_and_fails_fast_when_open():
+    guard = UpstreamGuard(breaker(), AdaptiveLimiter(initial=4))
+    for _ in range(4):
+        with pytest.raises(UpstreamUnavailable):
+            with guard.guard():
+                raise UpstreamUnavailable('Skillrack returned HTTP 503')
+    assert guard.breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        with guard.guard():
+            pass
+    assert guard.limiter.status()['in_flight'] == 0
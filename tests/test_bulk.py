@@ -0,0 +1,68 @@
+import io
+import json
+import os
+import time
+
+import pytest
+
+import bulk
+from breaker import CircuitOpenError, UpstreamUnavailable
+from records import ProfileRecord
+
+
+def write_urls(tmp_path, count):
+    path = tmp_path / 'urls.txt'
+    path.write_text(''.join(f'https://www.skillrack.com/profile/{n}/abc\n' for n in range(count)))
+    return str(path)
+
+
+def profile(url):
+    return ProfileRecord(id=url.split('/')[4], name='Ada', points=10, url=url)
+
+
+def test_exports_every_profile(monkeypatch, tmp_path):
+    monkeypatch.setattr(bulk, 'scrape_skillrack_profile', profile)
+    output = str(tmp_path / 'out.jsonl')
+    assert bulk.run(write_urls(tmp_path, 25), output, 'jsonl', concurrency=4, progress=io.StringIO()) == (25, 0)
+    with open(output) as f:
+        assert sorted(int(json.loads(line)['id']) for line in f) == list(range(25))
+    assert not os.path.exists(output + '.checkpoint')
+
+
+def test_wait_for_upstream_is_capped(monkeypatch):
+    calls = []
+
+    def unavailable(url):
+        calls.append(url)
+        raise UpstreamUnavailable('Too many Skillrack fetches in progress', retry_after=30)
+
+    monkeypatch.setattr(bulk, 'scrape_skillrack_profile', unavailable)
+    monkeypatch.setattr(bulk, 'BULK_UPSTREAM_MAX_WAIT', 1)
+    started = time.monotonic()
+    with pytest.raises(UpstreamUnavailable):
+        bulk.scrape_url('https://www.skillrack.com/profile/1/abc')
+    assert time.monotonic() - started < 1
+    assert len(calls) == 1
+
+
+def test_open_circuit_stops_the_run_with_a_checkpoint(monkeypatch, tmp_path):
+    def scrape(url):
+        if int(url.split('/')[4]) >= 10:
+            raise CircuitOpenError('Skillrack is unavailable (circuit open)', retry_after=0.01)
+        return profile(url)
+
+    monkeypatch.setattr(bulk, 'scrape_skillrack_profile', scrape)
+    monkeypatch.setattr(bulk, 'BULK_UPSTREAM_MAX_WAIT', 0.1)
+    urls = write_urls(tmp_path, 40)
+    output = str(tmp_path / 'out.jsonl')
+    with pytest.raises(SystemExit):
+        bulk.run(urls, output, 'jsonl', concurrency=1, progress=io.StringIO())
+    with open(output + '.checkpoint') as f:
+        checkpoint = json.load(f)
+    assert (checkpoint['next'], checkpoint['written'], checkpoint['failed']) == (10, 10, 0)
+
+    # Once Skillrack is back, the same command picks up where the run stopped
+    monkeypatch.setattr(bulk, 'scrape_skillrack_profile', profile)
+    assert bulk.run(urls, output, 'jsonl', concurrency=4, progress=io.StringIO()) == (40, 0)
+    with open(output) as f:
+        assert len(f.readlines()) == 40
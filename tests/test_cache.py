@@ -0,0 +1,130 @@
+import threading
+import time
+
+import pytest
+
+from cache import MemoryBackend, ProfileCache, normalize_profile_key
+from records import ProfileRecord
+
+
+def age(cache, key, seconds):
+    value, _ = cache.backend.get(key)
+    cache.backend.set(key, value, time.time() - seconds)
+
+
+def wait_until(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.005)
+
+
+@pytest.mark.parametrize('url', [
+    'https://www.skillrack.com/faces/resume.xhtml?id=42&key=abc',
+    'https://www.skillrack.com/profile/42/abc',
+    ' https://www.skillrack.com/profile/42/abc/ ',
+])
+def test_both_link_forms_share_a_key(url):
+    assert normalize_profile_key(url) == 'skillrack:42:abc'
+
+
+def test_fresh_entries_are_served_from_the_cache():
+    cache = ProfileCache(MemoryBackend(), ttl=60)
+    calls = []
+    fetch = lambda: calls.append(1) or {'points': len(calls)}
+    assert cache.get_or_fetch('k', fetch) == {'points': 1}
+    assert cache.get_or_fetch('k', fetch) == {'points': 1}
+    assert len(calls) == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_entries_past_ttl_and_stale_ttl_are_fetched_again():
+    cache = ProfileCache(MemoryBackend(), ttl=60, stale_ttl=60)
+    cache.get_or_fetch('k', lambda: {'points': 1})
+    age(cache, 'k', 121)
+    assert cache.get_or_fetch('k', lambda: {'points': 2}) == {'points': 2}
+    assert cache.misses == 2
+
+
+def test_stale_entry_is_served_while_one_refresh_runs():
+    cache = ProfileCache(MemoryBackend(), ttl=60, stale_ttl=600)
+    cache.get_or_fetch('k', lambda: {'points': 1})
+    age(cache, 'k', 61)
+    release = threading.Event()
+    refreshes = []
+
+    def refresh():
+        refreshes.append(1)
+        release.wait(2)
+        return {'points': 2}
+
+    assert cache.get_or_fetch('k', refresh) == {'points': 1}
+    assert cache.get_or_fetch('k', refresh) == {'points': 1}
+    release.set()
+    wait_until(lambda: cache.peek('k') == ({'points': 2}, False))
+    assert len(refreshes) == 1
+    assert cache.stale_hits == 2
+
+
+def test_background_refreshes_are_bounded():
+    cache = ProfileCache(MemoryBackend(), ttl=60, stale_ttl=600, max_refreshes=2)
+    for n in range(5):
+        cache.get_or_fetch(f'k{n}', lambda: {'points': 1})
+        age(cache, f'k{n}', 61)
+    release = threading.Event()
+    running = []
+
+    def refresh():
+        running.append(threading.current_thread().name)
+        release.wait(2)
+        return {'points': 2}
+
+    for n in range(5):
+        assert cache.get_or_fetch(f'k{n}', refresh) == {'points': 1}
+    wait_until(lambda: len(running) == 2)
+    time.sleep(0.05)
+    assert len(running) == 2
+    release.set()
+    wait_until(lambda: not cache._refreshing)
+    # Keys skipped while the pool was full refresh on a later lookup
+    cache.get_or_fetch('k4', refresh)
+    wait_until(lambda: cache.peek('k4') == ({'points': 2}, False))
+
+
+def test_failed_refresh_keeps_the_stale_copy():
+    cache = ProfileCache(MemoryBackend(), ttl=60, stale_ttl=600)
+    cache.get_or_fetch('k', lambda: {'points': 1})
+    age(cache, 'k', 61)
+
+    def fail():
+        raise RuntimeError('upstream down')
+
+    cache.get_or_fetch('k', fail)
+    wait_until(lambda: not cache._refreshing)
+    assert cache.peek('k') == ({'points': 1}, True)
+
+
+def test_lru_evicts_the_least_recently_used_entry():
+    backend = MemoryBackend(max_entries=2)
+    backend.set('a', {'n': 1}, time.time())
+    backend.set('b', {'n': 2}, time.time())
+    backend.get('a')
+    backend.set('c', {'n': 3}, time.time())
+    assert backend.get('b') is None
+    assert backend.get('a') is not None and backend.get('c') is not None
+
+
+def test_lru_is_bounded_by_size():
+    record = ProfileRecord(id='1', name='Ada', points=10, url='https://www.skillrack.com/profile/1/abc')
+    backend = MemoryBackend(max_entries=100, max_bytes=record.footprint() * 3)
+    for n in range(10):
+        backend.set(str(n), record, time.time())
+    assert len(backend) == 3
+    assert backend.size <= backend.max_bytes
+    assert [backend.get(str(n)) is not None for n in (6, 7, 8, 9)] == [False, True, True, True]
+
+
+def test_cached_dicts_are_copies():
+    cache = ProfileCache(MemoryBackend(), ttl=60)
+    cache.get_or_fetch('k', lambda: {'points': 1})['points'] = 99
+    assert cache.get_or_fetch('k', lambda: {'points': 2}) == {'points': 1}
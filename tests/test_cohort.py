@@ -0,0 +1,43 @@
+from datetime import datetime
+
+import pytest
+
+from cohort import compute_cohort, is_on_track
+from scrape import add_track_status
+
+
+@pytest.mark.parametrize('days_left, points, required, expected', [
+    (10, 4960, 5000, True),
+    (10, 4950, 5000, False),
+    (0, 5000, 5000, True),
+    # Past the required points stays on track even after the lastdate
+    (-5, 6000, 5000, True),
+    (-5, 4000, 5000, False),
+])
+def test_on_track_rule(days_left, points, required, expected):
+    assert is_on_track(days_left, points, required) == expected
+
+
+def profile(n, points, required=5000):
+    return {'id': str(n), 'name': f'Student {n}', 'points': points, 'required_points': required,
+            'url': f'https://www.skillrack.com/profile/{n}/abc'}
+
+
+def test_cohort_ranks_and_classifies():
+    today = datetime(2024, 3, 1)
+    profiles = [profile(1, 4000), profile(2, 4990), profile(3, 6000), profile(4, 4990), profile(5, '-')]
+    cohort = compute_cohort(profiles, '11-03-2024', today=today)
+    assert cohort['days_left'] == 10
+    assert [row['id'] for row in cohort['leaderboard']] == ['3', '2', '4', '1', '5']
+    assert [row['rank'] for row in cohort['leaderboard']] == [1, 2, 2, 4, 5]
+    assert cohort['on_track'] == [profiles[i]['url'] for i in (2, 1, 3)]
+    assert cohort['leaderboard'][0]['points_to_complete'] == 0
+
+
+def test_cohort_and_trackwithbuddy_agree():
+    lastdate = '01-01-2000'
+    profiles = [profile(1, 6000), profile(2, 4000)]
+    cohort = compute_cohort(profiles, lastdate)
+    statuses = {row['url']: row['status'] for row in cohort['leaderboard']}
+    for data in profiles:
+        assert add_track_status(dict(data), lastdate)['status'] == statuses[data['url']]
@@ -0,0 +1,105 @@
+import asyncio
+import io
+import json
+import socket
+import threading
+import time
+
+import pytest
+
+import fetch
+import scrape
+import serverless
+from breaker import UpstreamGuard, UpstreamUnavailable
+from cache import MemoryBackend, ProfileCache, normalize_profile_key
+from records import ProfileRecord
+from singleflight import SingleFlight
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    # get_profile with its own cache and breaker, and no retries
+    cache = ProfileCache(MemoryBackend(), ttl=300, stale_ttl=60)
+    monkeypatch.setattr(fetch, 'upstream_guard', UpstreamGuard())
+    monkeypatch.setattr(fetch, 'MAX_RETRIES', 0)
+    monkeypatch.setattr(scrape, 'profile_cache', cache)
+    monkeypatch.setattr(scrape, 'profile_flight', SingleFlight(lock_dir=''))
+    monkeypatch.setattr(scrape, 'profile_refresher', None)
+    return cache
+
+
+@pytest.fixture
+def refused_url():
+    # A port nothing listens on
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    return f'http://127.0.0.1:{port}/profile/7/abc'
+
+
+@pytest.fixture
+def truncated_url():
+    # Promises a longer body than it sends, then hangs up
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen()
+
+    def serve():
+        while True:
+            try:
+                conn, _ = server.accept()
+            except OSError:
+                return
+            with conn:
+                conn.recv(65536)
+                conn.sendall(b'HTTP/1.1 200 OK\r\nContent-Type: text/html\r\nContent-Length: 5000\r\n\r\n<html><body>')
+
+    threading.Thread(target=serve, daemon=True).start()
+    yield f'http://127.0.0.1:{server.getsockname()[1]}/profile/7/abc'
+    server.close()
+
+
+def post(path, data):
+    body = json.dumps(data).encode('utf-8')
+    environ = {'REQUEST_METHOD': 'POST', 'PATH_INFO': path, 'CONTENT_LENGTH': str(len(body)),
+               'wsgi.input': io.BytesIO(body)}
+    started = {}
+
+    def start_response(status, headers):
+        started.update(status=int(status.split()[0]), headers=dict(headers))
+
+    response = b''.join(serverless.app(environ, start_response))
+    return started['status'], started['headers'], json.loads(response)
+
+
+def test_unreachable_upstream_without_a_cached_copy_is_503(upstream, refused_url):
+    status, headers, data = post('/api/points', {'url': refused_url})
+    assert status == 503
+    assert int(headers['Retry-After']) >= 1
+    assert 'could not be reached' in data['error']
+
+
+def test_unreachable_upstream_serves_the_last_known_copy(upstream, refused_url):
+    record = ProfileRecord(id='7', name='Ada', points=120, url=refused_url)
+    upstream.backend.set(normalize_profile_key(refused_url), record, time.time() - 3600)
+    status, _, data = post('/api/points', {'url': refused_url})
+    assert status == 200
+    assert data['name'] == 'Ada'
+    assert data['stale'] is True
+
+
+def test_cut_off_body_counts_as_unreachable(upstream, truncated_url):
+    with pytest.raises(UpstreamUnavailable):
+        fetch.fetch_page(truncated_url)
+    assert fetch.upstream_guard.breaker.status()['recent_failures'] == 1
+
+
+def test_unreachable_upstream_async(upstream, refused_url):
+    async def fetch_once():
+        try:
+            await fetch.fetch_page_async(refused_url)
+        finally:
+            await fetch.close_async_client()
+
+    with pytest.raises(UpstreamUnavailable):
+        asyncio.run(fetch_once())
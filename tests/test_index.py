@@ -0,0 +1,48 @@
+import pytest
+
+import index
+import scrape
+from breaker import UpstreamUnavailable
+from cache import MemoryBackend, ProfileCache
+from ratelimit import RateLimited
+from records import ProfileRecord
+
+URL = 'https://www.skillrack.com/faces/resume.xhtml?id=7&key=abc'
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(scrape, 'profile_cache', ProfileCache(MemoryBackend(), ttl=300))
+    monkeypatch.setattr(scrape, 'profile_refresher', None)
+    return index.app.test_client()
+
+
+def fail_with(monkeypatch, error):
+    def fetch_profile(key, url, scraper=None):
+        raise error
+    monkeypatch.setattr(scrape, 'fetch_profile', fetch_profile)
+
+
+@pytest.mark.parametrize('error, status', [
+    (UpstreamUnavailable('Skillrack is unavailable (circuit open)', retry_after=7.4), 503),
+    (RateLimited('Too many requests, slow down', retry_after=2), 429),
+])
+def test_errors_match_app_py(monkeypatch, client, error, status):
+    fail_with(monkeypatch, error)
+    response = client.get('/api/points/' + URL)
+    assert response.status_code == status
+    assert response.get_json() == {'error': str(error)}
+    assert response.headers['Retry-After'] == ('7' if status == 503 else '2')
+
+
+def test_profile_gets_an_etag_and_a_304(monkeypatch, client):
+    record = ProfileRecord(id='7', name='Ada', points=120, url=URL)
+    monkeypatch.setattr(scrape, 'fetch_profile', lambda key, url, scraper=None: record)
+    response = client.get('/api/points/' + URL)
+    assert response.status_code == 200
+    assert response.get_json()['name'] == 'Ada'
+    etag = response.headers['ETag']
+    response = client.get('/api/points/' + URL, headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+    assert response.headers['ETag'] == etag
@@ -0,0 +1,57 @@
+import os
+
+import pytest
+
+from parsers import ENGINES, ProfileStreamParser, extract_profile_bs4, extract_profile_stream
+from scrape import STAT_EXTRACTORS
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'fixtures', 'profiles')
+FIXTURES = sorted(name for name in os.listdir(FIXTURES_DIR) if name.endswith('.html'))
+
+
+def load(name):
+    with open(os.path.join(FIXTURES_DIR, name), encoding='utf-8') as f:
+        return f.read()
+
+
+def wanted(extracted):
+    return [(label, value) for label, value in extracted['stats'] if label in STAT_EXTRACTORS]
+
+
+@pytest.mark.parametrize('name', FIXTURES)
+@pytest.mark.parametrize('engine', sorted(ENGINES))
+def test_engines_match_bs4(engine, name):
+    html = load(name)
+    assert ENGINES[engine](html) == extract_profile_bs4(html)
+
+
+@pytest.mark.parametrize('name', FIXTURES)
+def test_early_stop_keeps_every_wanted_statistic(name):
+    html = load(name)
+    extracted = extract_profile_stream(html, STAT_EXTRACTORS)
+    expected = extract_profile_bs4(html)
+    assert (extracted['name'], extracted['profile']) == (expected['name'], expected['profile'])
+    assert wanted(extracted) == wanted(expected)
+
+
+def test_statistics_split_over_two_containers():
+    extracted = extract_profile_stream(load('split_stats.html'), STAT_EXTRACTORS)
+    labels = [label for label, _ in extracted['stats']]
+    assert labels[:3] == ['CODE TUTOR', 'CODE TRACK', 'CODE TEST']
+    assert {'DT', 'DC', 'Deadline'} <= set(labels)
+
+
+def test_stops_once_the_wanted_labels_are_in():
+    html = load('split_stats.html')
+    parser = ProfileStreamParser(('CODE TUTOR', 'CODE TRACK', 'CODE TEST'))
+    cut = html.index('Certificates')
+    parser.feed(html[:cut])
+    assert parser.done
+    assert [label for label, _ in parser.result()['stats']] == ['CODE TUTOR', 'CODE TRACK', 'CODE TEST']
+
+
+def test_reads_the_whole_page_without_labels():
+    html = load('split_stats.html')
+    parser = ProfileStreamParser()
+    parser.feed(html[:html.index('Certificates')])
+    assert not parser.done
@@ -0,0 +1,130 @@
+import threading
+import time
+
+import pytest
+
+import scrape
+from cache import MemoryBackend, ProfileCache
+from ratelimit import FairQueue, RateLimited
+from singleflight import SingleFlight
+
+
+def start(target, *args):
+    thread = threading.Thread(target=target, args=args, daemon=True)
+    thread.start()
+    return thread
+
+
+def wait_until(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.005)
+
+
+def test_fair_queue_takes_turns_across_clients():
+    queue = FairQueue(lambda: 1, per_client=4, max_queued=8, timeout=5)
+    release = threading.Event()
+    order = []
+
+    def run(client, name):
+        queue.run(client, lambda: order.append(name))
+
+    blocker = start(queue.run, 'a', release.wait)
+    wait_until(lambda: queue.active == 1)
+    threads = [start(run, 'a', 'a1'), start(run, 'a', 'a2')]
+    wait_until(lambda: queue.status()['waiting'] == 2)
+    threads.append(start(run, 'b', 'b1'))
+    wait_until(lambda: queue.status()['waiting'] == 3)
+    release.set()
+    for thread in [blocker] + threads:
+        thread.join(2)
+
+    assert order == ['a1', 'b1', 'a2']
+    assert queue.status() == {'active': 0, 'clients_waiting': 0, 'waiting': 0, 'rejected': 0}
+
+
+def test_fair_queue_caps_each_client():
+    queue = FairQueue(lambda: 10, per_client=2, max_queued=8, timeout=5)
+    release = threading.Event()
+    threads = [start(queue.run, 'a', release.wait) for _ in range(3)]
+    wait_until(lambda: queue.active == 2 and queue.status()['waiting'] == 1)
+    # Another client still gets a free slot right away
+    assert queue.run('b', lambda: 'done') == 'done'
+    release.set()
+    for thread in threads:
+        thread.join(2)
+    assert queue.active == 0
+
+
+def test_fair_queue_rejects_when_full_or_timed_out():
+    queue = FairQueue(lambda: 1, per_client=1, max_queued=1, timeout=0.1)
+    release = threading.Event()
+    blocker = start(queue.run, 'a', release.wait)
+    wait_until(lambda: queue.active == 1)
+    waiter = start(lambda: pytest.raises(RateLimited, queue.run, 'a', lambda: None))
+    wait_until(lambda: queue.status()['waiting'] == 1)
+    with pytest.raises(RateLimited):
+        queue.run('a', lambda: None)
+    waiter.join(2)
+    release.set()
+    blocker.join(2)
+    assert queue.rejected == 2
+    assert queue.status()['waiting'] == 0
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    # get_profile with its own cache, flight and a one-slot queue, and a scrape that blocks
+    # until released
+    queue = FairQueue(lambda: 1, per_client=1, max_queued=8, timeout=5)
+    cache = ProfileCache(MemoryBackend(), ttl=300)
+    release = threading.Event()
+    scrapes = []
+
+    def fetch_profile(key, url, scraper=None):
+        scrapes.append(url)
+        release.wait(2)
+        return {'url': url}
+
+    monkeypatch.setattr(scrape, 'scrape_queue', queue)
+    monkeypatch.setattr(scrape, 'profile_cache', cache)
+    monkeypatch.setattr(scrape, 'profile_flight', SingleFlight(lock_dir=''))
+    monkeypatch.setattr(scrape, 'profile_refresher', None)
+    monkeypatch.setattr(scrape, 'fetch_profile', fetch_profile)
+    return queue, cache, release, scrapes
+
+
+def test_clients_join_a_flight_waiting_in_the_queue(pipeline):
+    queue, cache, release, scrapes = pipeline
+    url = 'https://www.skillrack.com/profile/1/abc'
+    results = []
+    blocker = start(queue.run, 'busy', lambda: release.wait(2))
+    wait_until(lambda: queue.active == 1)
+    threads = [start(lambda client=client: results.append(scrape.get_profile(url, client))) for client in 'abc']
+    # Only the flight leader queues; the other clients wait on its flight
+    wait_until(lambda: queue.status()['waiting'] == 1)
+    time.sleep(0.05)
+    assert queue.status()['waiting'] == 1
+    release.set()
+    for thread in [blocker] + threads:
+        thread.join(2)
+    assert scrapes == [url]
+    assert results == [{'url': url}] * 3
+
+
+def test_queued_fetch_uses_a_profile_cached_meanwhile(pipeline):
+    queue, cache, release, scrapes = pipeline
+    url = 'https://www.skillrack.com/profile/1/abc'
+    key = scrape.normalize_profile_key(url)
+    results = []
+    blocker = start(queue.run, 'busy', lambda: release.wait(2))
+    wait_until(lambda: queue.active == 1)
+    thread = start(lambda: results.append(scrape.get_profile(url, 'a')))
+    wait_until(lambda: queue.status()['waiting'] == 1)
+    cache.put(key, {'url': url, 'cached': True})
+    release.set()
+    for t in (blocker, thread):
+        t.join(2)
+    assert scrapes == []
+    assert results == [{'url': url, 'cached': True}]
@@ -0,0 +1,68 @@
+import json
+
+from records import ProfileRecord, decode_value, dumps, dumps_profiles, encode_value, etag_matches
+
+
+def record(**fields):
+    data = dict(id='7', name='Ada', dept='CSE', year='2025', college='ABC', code_tutor=154, code_track=612,
+                code_test=41, dt=27, dc=118, required_points=5000, deadline='30-04-2024', percentage=100,
+                last_fetched='2024-03-01 10:00:00', url='https://www.skillrack.com/profile/7/abc')
+    data.update(fields)
+    return ProfileRecord(**data).compute_derived()
+
+
+def test_json_matches_jsonify():
+    profile = record()
+    expected = json.dumps(profile.to_dict(), sort_keys=True, separators=(',', ':')).encode('utf-8')
+    assert profile.json_bytes() == expected
+    assert dumps(profile.to_dict()) == expected
+    assert 'stale' not in profile
+
+
+def test_reads_like_the_old_dict():
+    profile = record()
+    assert profile['points'] == 41 * 30 + 118 * 2 + 27 * 20 + 612 * 2
+    assert profile.get('stale', False) is False
+    assert dict(profile) == profile.to_dict()
+
+
+def test_from_json_round_trip_reuses_the_bytes():
+    profile = record()
+    decoded = ProfileRecord.from_json(profile.json_bytes())
+    assert decoded == profile
+    assert decoded.json_bytes() is decoded._json
+    # Records built any other way don't keep an encoded copy around
+    profile.json_bytes()
+    assert profile._json is None
+
+
+def test_stale_copy_leaves_the_original_alone():
+    profile = record()
+    stale = profile.as_stale()
+    assert stale['stale'] is True
+    assert 'stale' not in profile
+
+
+def test_etag_ignores_when_the_profile_was_fetched():
+    assert record().etag() == record(last_fetched='2024-03-02 09:00:00').etag()
+    assert record().etag() != record(dc=119).etag()
+
+
+def test_etag_matching():
+    etag = record().etag()
+    assert etag_matches(etag, etag)
+    assert etag_matches(f'"other", {etag[2:]}', etag)
+    assert etag_matches('*', etag)
+    assert not etag_matches(None, etag)
+    assert not etag_matches('W/"other"', etag)
+
+
+def test_encoded_values_keep_records_apart_from_dicts():
+    profile = record()
+    assert decode_value(json.loads(json.dumps(encode_value(profile)))) == profile
+    assert decode_value(encode_value({'points': 1})) == {'points': 1}
+
+
+def test_dumps_profiles_splices_records():
+    profiles = {'b': record(id='2'), 'a': record(id='1')}
+    assert json.loads(dumps_profiles(profiles)) == {url: p.to_dict() for url, p in profiles.items()}
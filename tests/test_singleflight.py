@@ -0,0 +1,78 @@
+import multiprocessing
+import os
+import threading
+import time
+
+from singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_result():
+    flight = SingleFlight(lock_dir='')
+    release = threading.Event()
+    calls = []
+    results = []
+
+    def fetch():
+        calls.append(1)
+        release.wait(2)
+        return {'points': 10}
+
+    threads = [threading.Thread(target=lambda: results.append(flight.do('k', fetch))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    while flight.coalesced < 4:
+        time.sleep(0.005)
+    release.set()
+    for thread in threads:
+        thread.join(2)
+    assert len(calls) == 1
+    assert results == [{'points': 10}] * 5
+    # Each caller gets its own copy
+    assert len({id(result) for result in results}) == 5
+
+
+def _slow_leader(lock_dir, started):
+    flight = SingleFlight(lock_dir=lock_dir)
+
+    def fetch():
+        started.set()
+        time.sleep(0.3)
+        return {'points': 42}
+
+    flight.do('skillrack:1:abc', fetch)
+
+
+def test_workers_share_one_fetch(tmp_path):
+    context = multiprocessing.get_context('fork')
+    started = context.Event()
+    leader = context.Process(target=_slow_leader, args=(str(tmp_path), started))
+    leader.start()
+    assert started.wait(5)
+    flight = SingleFlight(lock_dir=str(tmp_path))
+    calls = []
+    assert flight.do('skillrack:1:abc', lambda: calls.append(1) or {'points': 0}) == {'points': 42}
+    leader.join(5)
+    assert calls == []
+    assert flight.coalesced == 1
+
+
+def test_lock_files_are_bounded(tmp_path):
+    flight = SingleFlight(lock_dir=str(tmp_path), stripes=8)
+    for n in range(200):
+        assert flight.do(f'skillrack:{n}:abc', lambda n=n: {'points': n}) == {'points': n}
+    assert len(os.listdir(tmp_path)) <= 8
+
+
+def test_other_keys_on_a_stripe_are_not_reused(tmp_path):
+    flight = SingleFlight(lock_dir=str(tmp_path), stripes=1)
+    release = threading.Event()
+    leader = threading.Thread(target=flight.do, args=('a', lambda: release.wait(2) and {'key': 'a'}))
+    leader.start()
+    time.sleep(0.05)
+    follower = []
+    thread = threading.Thread(target=lambda: follower.append(flight.do('b', lambda: {'key': 'b'})))
+    thread.start()
+    release.set()
+    for t in (leader, thread):
+        t.join(2)
+    assert follower == [{'key': 'b'}]
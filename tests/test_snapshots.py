@@ -0,0 +1,70 @@
+import threading
+
+from snapshots import SnapshotStore
+
+KEY = 'skillrack:1:abc'
+
+
+def profile(fetched_at, points=100, dc=10):
+    return {'id': '1', 'last_fetched': fetched_at, 'code_tutor': 5, 'code_track': 20, 'code_test': 1,
+            'dt': 2, 'dc': dc, 'points': points}
+
+
+def rows(store):
+    return [(row['fetched_at'], row['points']) for row in store.history(KEY, limit=-1)]
+
+
+def test_unchanged_counters_are_not_recorded_again(tmp_path):
+    store = SnapshotStore(str(tmp_path / 'snapshots.db'))
+    assert store.record(KEY, profile('2024-03-01 10:00:00'))
+    assert not store.record(KEY, profile('2024-03-01 10:05:00'))
+    assert store.record(KEY, profile('2024-03-01 10:10:00', points=102, dc=11))
+    # Going back to earlier counters is a change too
+    assert store.record(KEY, profile('2024-03-01 10:15:00'))
+    assert rows(store) == [('2024-03-01 10:00:00', 100), ('2024-03-01 10:10:00', 102), ('2024-03-01 10:15:00', 100)]
+
+
+def test_workers_and_restarts_share_the_dedupe(tmp_path):
+    path = str(tmp_path / 'snapshots.db')
+    first, second = SnapshotStore(path), SnapshotStore(path)
+    assert first.record(KEY, profile('2024-03-01 10:00:00'))
+    assert not second.record(KEY, profile('2024-03-01 10:01:00'))
+    assert not SnapshotStore(path).record(KEY, profile('2024-03-02 09:00:00'))
+    assert len(rows(first)) == 1
+
+
+def test_dedupe_follows_rows_written_by_other_workers(tmp_path):
+    path = str(tmp_path / 'snapshots.db')
+    first, second = SnapshotStore(path), SnapshotStore(path)
+    assert first.record(KEY, profile('2024-03-01 10:00:00'))
+    assert second.record(KEY, profile('2024-03-01 10:01:00', points=102, dc=11))
+    assert not first.record(KEY, profile('2024-03-01 10:02:00', points=102, dc=11))
+    assert first.record(KEY, profile('2024-03-01 10:03:00'))
+    assert [points for _, points in rows(first)] == [100, 102, 100]
+
+
+def test_concurrent_writers_record_one_row(tmp_path):
+    path = str(tmp_path / 'snapshots.db')
+    SnapshotStore(path).record('other', profile('2024-03-01 09:00:00'))
+    stores = [SnapshotStore(path) for _ in range(8)]
+    barrier = threading.Barrier(len(stores))
+    results = []
+
+    def record(store):
+        barrier.wait()
+        results.append(store.record(KEY, profile('2024-03-01 10:00:00')))
+
+    threads = [threading.Thread(target=record, args=(store,)) for store in stores]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    assert sorted(results) == [False] * 7 + [True]
+    assert len(rows(stores[0])) == 1
+
+
+def test_missing_counters_compare_equal(tmp_path):
+    store = SnapshotStore(str(tmp_path / 'snapshots.db'))
+    data = dict(profile('2024-03-01 10:00:00'), dc=None)
+    assert store.record(KEY, data)
+    assert not store.record(KEY, dict(data, last_fetched='2024-03-01 10:05:00'))